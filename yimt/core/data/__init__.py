@@ -20,4 +20,12 @@ from yimt.core.data.noise import (
     WordPermutation,
     WordReplacement,
 )
-from yimt.core.data.vocab import Vocab, create_lookup_tables
+from yimt.core.data.vocab import (
+    GatherLookupTable,
+    HashLookupTable,
+    Vocab,
+    create_hash_lookup_table,
+    create_ids_to_tokens_table,
+    create_lookup_tables,
+    get_token_id,
+)
@@ -1,9 +1,20 @@
 """Vocabulary utilities for Python scripts."""
 
+import collections
+import functools
+import sys
+
+import numpy as np
 import tensorflow as tf
 
 from yimt.core import constants
 
+_SENTENCEPIECE_SPECIAL_TOKENS = frozenset(("<unk>", "<s>", "</s>"))
+
+# Lookup tables created by create_lookup_tables, in least recently used order.
+_LOOKUP_TABLES_CACHE = collections.OrderedDict()
+_LOOKUP_TABLES_CACHE_SIZE = 8
+
 
 class Vocab(object):
     """Vocabulary class.
@@ -28,18 +39,23 @@ class Vocab(object):
           special_tokens: A list of special tokens (e.g. start of sentence).
         """
         self._token_to_id = {}
+        # The token strings are shared with the keys of _token_to_id, so this list
+        # only adds one pointer per entry.
         self._id_to_token = []
-        self._frequency = []
+        # Frequencies are stored in a growing buffer: only the first self.size
+        # entries are valid. The buffer is only allocated when an entry has a
+        # frequency different than 1, which is never the case for vocabularies
+        # loaded from a file.
+        self._frequency = None
 
         if special_tokens is not None:
-            for index, token in enumerate(special_tokens):
-                self._token_to_id[token] = index
-                self._id_to_token.insert(index, token)
-
+            for token in special_tokens:
                 # Set a very high frequency to avoid special tokens to be pruned.
-                # Note that Python sort functions are stable which means that
+                # Note that the sort in prune is stable which means that
                 # special tokens in pruned vocabularies will have the same index.
-                self._frequency.insert(index, float("inf"))
+                self._extend_frequency(1, value=np.inf)
+                self._token_to_id[token] = len(self._id_to_token)
+                self._id_to_token.append(token)
 
     @classmethod
     def from_file(cls, path, file_format="default"):
@@ -71,8 +87,16 @@ class Vocab(object):
         """Returns the number of entries of the vocabulary."""
         return self.size
 
+    def __iter__(self):
+        """Iterates over the tokens of the vocabulary, by increasing id."""
+        return iter(self._id_to_token)
+
     def __contains__(self, token):
         """Returns ``True`` if the vocabulary contains :obj:`token`."""
+        if isinstance(token, (bytes, str)):
+            if type(token) is not str:
+                token = tf.compat.as_text(token)
+            return token in self._token_to_id
         return self.lookup(token) is not None
 
     def add_from_text(self, filename, tokenizer=None):
@@ -82,6 +106,7 @@ class Vocab(object):
           filename: The file to load from.
           tokenizer: A callable to tokenize a line of text.
         """
+        counter = collections.Counter()
         with tf.io.gfile.GFile(filename) as text:
             for line in text:
                 line = line.rstrip("\r\n")
@@ -89,8 +114,21 @@ class Vocab(object):
                     tokens = tokenizer.tokenize(line)
                 else:
                     tokens = line.split()
-                for token in tokens:
-                    self.add(token)
+                counter.update(tokens)
+
+        # Counter preserves the insertion order so new tokens are added in the
+        # order of their first occurrence.
+        for token, count in counter.items():
+            if type(token) is not str:
+                token = tf.compat.as_text(token)
+            index = self._token_to_id.get(token)
+            if index is None:
+                token = sys.intern(str(token))
+                self._extend_frequency(1, value=count)
+                self._token_to_id[token] = self.size
+                self._id_to_token.append(token)
+            else:
+                self._increment_frequency(index, count)
 
     def serialize(self, path):
         """Writes the vocabulary on disk.
@@ -99,9 +137,7 @@ class Vocab(object):
           path: The path where the vocabulary will be saved.
         """
         with tf.io.gfile.GFile(path, mode="w") as vocab:
-            for token in self._id_to_token:
-                vocab.write(token)
-                vocab.write("\n")
+            vocab.write("".join("%s\n" % token for token in self._id_to_token))
 
     def load(self, path, file_format="default"):
         """Loads a serialized vocabulary.
@@ -117,26 +153,52 @@ class Vocab(object):
         if file_format not in ("default", "sentencepiece"):
             raise ValueError("Invalid vocabulary format: %s" % file_format)
         with tf.io.gfile.GFile(path) as vocab:
-            for i, line in enumerate(vocab):
-                token = line.rstrip("\r\n")
-                if file_format == "sentencepiece":
-                    token, _ = token.split("\t")
-                    # Ignore SentencePiece special tokens.
-                    if token in ("<unk>", "<s>", "</s>"):
-                        continue
-
-                if token in self._token_to_id:
-                    tf.get_logger().warning(
-                        "Duplicate token '%s' in vocabulary %s at line %d",
-                        token,
-                        path,
-                        i + 1,
-                    )
-                    continue
-
-                self._token_to_id[token] = len(self._id_to_token)
-                self._id_to_token.append(token)
-                self._frequency.append(1)
+            lines = vocab.read().split("\n")
+        if lines and not lines[-1]:
+            lines.pop()
+
+        # Tokens are interned so that equal tokens share the same object.
+        if file_format == "sentencepiece":
+            tokens = [sys.intern(line.rstrip("\r").split("\t", 1)[0]) for line in lines]
+            # Ignore SentencePiece special tokens.
+            new_tokens = [
+                token for token in tokens if token not in _SENTENCEPIECE_SPECIAL_TOKENS
+            ]
+        else:
+            tokens = [sys.intern(line.rstrip("\r")) for line in lines]
+            new_tokens = tokens
+
+        has_duplicates = len(set(new_tokens)) != len(new_tokens)
+        if not has_duplicates and self._token_to_id.keys().isdisjoint(new_tokens):
+            offset = self.size
+            self._extend_frequency(len(new_tokens))
+            self._id_to_token.extend(new_tokens)
+            self._token_to_id.update(
+                zip(new_tokens, range(offset, offset + len(new_tokens)))
+            )
+            return
+
+        # Slow path: report and skip duplicate tokens.
+        self._reserve_frequency(self.size + len(new_tokens))
+        for i, token in enumerate(tokens):
+            if (
+                file_format == "sentencepiece"
+                and token in _SENTENCEPIECE_SPECIAL_TOKENS
+            ):
+                continue
+
+            if token in self._token_to_id:
+                tf.get_logger().warning(
+                    "Duplicate token '%s' in vocabulary %s at line %d",
+                    token,
+                    path,
+                    i + 1,
+                )
+                continue
+
+            self._extend_frequency(1)
+            self._token_to_id[token] = len(self._id_to_token)
+            self._id_to_token.append(token)
 
     def add(self, token):
         """Adds a token or increases its frequency.
@@ -144,14 +206,17 @@ class Vocab(object):
         Args:
           token: The string to add.
         """
-        token = tf.compat.as_text(token)
+        # Only convert non string tokens: this method is called for every token
+        # when building a vocabulary from a corpus.
+        if type(token) is not str:
+            token = tf.compat.as_text(token)
         if token not in self._token_to_id:
-            index = self.size
-            self._token_to_id[token] = index
+            token = sys.intern(str(token))
+            self._extend_frequency(1)
+            self._token_to_id[token] = self.size
             self._id_to_token.append(token)
-            self._frequency.append(1)
         else:
-            self._frequency[self._token_to_id[token]] += 1
+            self._increment_frequency(self._token_to_id[token])
 
     def lookup(self, identifier, default=None):
         """Lookups in the vocabulary.
@@ -163,18 +228,45 @@ class Vocab(object):
         Returns:
           The value associated with :obj:`identifier` or :obj:`default`.
         """
-        value = None
-
         if isinstance(identifier, (bytes, str)):
-            identifier = tf.compat.as_text(identifier)
-            value = self._token_to_id.get(identifier)
-        elif identifier < self.size:
-            value = self._id_to_token[identifier]
+            if type(identifier) is not str:
+                identifier = tf.compat.as_text(identifier)
+            return self.get_id(identifier, default)
+        if identifier < self.size:
+            return self._id_to_token[identifier]
+        return default
 
-        if value is None:
-            return default
-        else:
-            return value
+    def get_id(self, token, default=None):
+        """Returns the id of a token.
+
+        Unlike :meth:`yimt.data.Vocab.lookup`, this method does not check the
+        argument type and expects a ``str``.
+
+        Args:
+          token: The token to lookup.
+          default: The value to return if :obj:`token` is not found.
+
+        Returns:
+          The id of :obj:`token` or :obj:`default`.
+        """
+        return self._token_to_id.get(token, default)
+
+    def get_token(self, index, default=None):
+        """Returns the token with an id.
+
+        Unlike :meth:`yimt.data.Vocab.lookup`, this method does not check the
+        argument type and expects an ``int``.
+
+        Args:
+          index: The id to lookup.
+          default: The value to return if :obj:`index` is out of range.
+
+        Returns:
+          The token with id :obj:`index` or :obj:`default`.
+        """
+        if 0 <= index < len(self._id_to_token):
+            return self._id_to_token[index]
+        return default
 
     def prune(self, max_size=0, min_frequency=1):
         """Creates a pruned version of the vocabulary.
@@ -184,37 +276,73 @@ class Vocab(object):
           min_frequency: The minimum frequency of each entry.
 
         Returns:
-          A new vocabulary.
+          A new vocabulary with entries sorted by decreasing frequency, so that
+          the most frequent tokens get the lowest ids once serialized.
         """
-        sorted_ids = sorted(
-            range(self.size), key=lambda k: self._frequency[k], reverse=True
+        # Sort by decreasing frequency. The sort is stable so entries with the
+        # same frequency keep their relative order.
+        if self._frequency is None:
+            frequency = np.ones(self.size, dtype=np.float64)
+        else:
+            frequency = self._frequency[: self.size]
+        negative_frequency = -frequency
+        sorted_ids = np.argsort(negative_frequency, kind="stable")
+
+        # Discard words that do not meet frequency requirements, but always keep
+        # the most frequent word.
+        new_size = np.searchsorted(
+            negative_frequency[sorted_ids], -min_frequency, side="right"
         )
-        new_size = len(sorted_ids)
-
-        # Discard words that do not meet frequency requirements.
-        for i in range(new_size - 1, 0, -1):
-            index = sorted_ids[i]
-            if self._frequency[index] < min_frequency:
-                new_size -= 1
-            else:
-                break
+        new_size = max(int(new_size), min(self.size, 1))
 
         # Limit absolute size.
         if max_size > 0:
             new_size = min(new_size, max_size)
 
+        sorted_ids = sorted_ids[:new_size].tolist()
         new_vocab = Vocab()
+        new_vocab._id_to_token = [self._id_to_token[index] for index in sorted_ids]
+        new_vocab._token_to_id = dict(zip(new_vocab._id_to_token, range(new_size)))
+        if self._frequency is not None:
+            new_vocab._frequency = self._frequency[sorted_ids]
+        return new_vocab
 
-        for i in range(new_size):
-            index = sorted_ids[i]
-            token = self._id_to_token[index]
-            frequency = self._frequency[index]
+    def _materialize_frequency(self):
+        """Allocates the frequency buffer if all frequencies are implicitly 1."""
+        if self._frequency is None:
+            self._frequency = np.ones(self.size, dtype=np.float64)
 
-            new_vocab._token_to_id[token] = i
-            new_vocab._id_to_token.append(token)
-            new_vocab._frequency.append(frequency)
+    def _increment_frequency(self, index, count=1):
+        """Increments the frequency of the entry :obj:`index`."""
+        self._materialize_frequency()
+        self._frequency[index] += count
 
-        return new_vocab
+    def _reserve_frequency(self, capacity):
+        """Grows the frequency buffer so that it can hold :obj:`capacity` entries.
+
+        The buffer capacity is at least doubled to amortize reallocations.
+        """
+        if self._frequency is not None and capacity > self._frequency.shape[0]:
+            size = self.size
+            frequency = np.zeros(
+                max(capacity, 2 * self._frequency.shape[0]), np.float64
+            )
+            frequency[:size] = self._frequency[:size]
+            self._frequency = frequency
+
+    def _extend_frequency(self, num_entries, value=1):
+        """Sets the frequency of the next :obj:`num_entries` entries.
+
+        This method should be called before adding the entries.
+        """
+        if self._frequency is None:
+            if value == 1:
+                return
+            self._materialize_frequency()
+        start = self.size
+        end = start + num_entries
+        self._reserve_frequency(end)
+        self._frequency[start:end] = value
 
     def pad_to_multiple(self, multiple, num_oov_buckets=1):
         """Pads the vocabulary size to a multiple value.
@@ -228,11 +356,22 @@ class Vocab(object):
           num_oov_buckets: The number of OOV buckets added during the training.
             Usually just 1 for the `<unk>` token.
         """
+        num_padding_tokens = -(self.size + num_oov_buckets) % multiple
+        padding_tokens = []
         i = 0
-        while (self.size + num_oov_buckets) % multiple != 0:
-            self.add("averyunlikelytoken%d" % i)
+        while len(padding_tokens) < num_padding_tokens:
+            token = "averyunlikelytoken%d" % i
+            if token not in self._token_to_id:
+                padding_tokens.append(token)
             i += 1
 
+        offset = self.size
+        self._extend_frequency(num_padding_tokens)
+        self._id_to_token.extend(padding_tokens)
+        self._token_to_id.update(
+            zip(padding_tokens, range(offset, offset + num_padding_tokens))
+        )
+
 
 def create_lookup_tables(
     vocabulary_path, num_oov_buckets=1, as_asset=True, unk_token=None
@@ -252,12 +391,46 @@ def create_lookup_tables(
       - The final vocabulary size.
       - The ``tf.lookup`` table mapping tokens to ids.
       - The ``tf.lookup`` table mapping ids to tokens.
+
+    Note:
+      In eager mode, the tables are cached and calling this function again with
+      the same arguments on an unmodified vocabulary file returns the same tables.
     """
     if unk_token is None:
         unk_token = constants.UNKNOWN_TOKEN
-    vocabulary = Vocab.from_file(vocabulary_path)
-    vocabulary_size = len(vocabulary)
+
+    # Tables are only reused in eager mode: graph tensors cannot be shared
+    # across graphs.
+    if not tf.executing_eagerly():
+        return _create_lookup_tables(
+            vocabulary_path, num_oov_buckets, as_asset, unk_token
+        )
+
+    cache_key = (
+        vocabulary_path,
+        tf.io.gfile.stat(vocabulary_path).mtime_nsec,
+        num_oov_buckets,
+        as_asset,
+        unk_token,
+    )
+    lookup_tables = _LOOKUP_TABLES_CACHE.get(cache_key)
+    if lookup_tables is not None:
+        _LOOKUP_TABLES_CACHE.move_to_end(cache_key)
+        return lookup_tables
+
+    lookup_tables = _create_lookup_tables(
+        vocabulary_path, num_oov_buckets, as_asset, unk_token
+    )
+    _LOOKUP_TABLES_CACHE[cache_key] = lookup_tables
+    if len(_LOOKUP_TABLES_CACHE) > _LOOKUP_TABLES_CACHE_SIZE:
+        _LOOKUP_TABLES_CACHE.popitem(last=False)
+    return lookup_tables
+
+
+def _create_lookup_tables(vocabulary_path, num_oov_buckets, as_asset, unk_token):
     if as_asset:
+        # The file is parsed by the table initializers, so only count the lines.
+        vocabulary_size = _count_vocabulary_lines(vocabulary_path)
         tokens_to_ids_initializer = tf.lookup.TextFileInitializer(
             vocabulary_path,
             tf.string,
@@ -275,8 +448,12 @@ def create_lookup_tables(
             vocab_size=vocabulary_size,
         )
     else:
-        tokens = tf.constant(vocabulary.words, dtype=tf.string)
-        ids = tf.constant(list(range(vocabulary_size)), dtype=tf.int64)
+        words = _load_vocabulary_words(
+            vocabulary_path, tf.io.gfile.stat(vocabulary_path).mtime_nsec
+        )
+        vocabulary_size = len(words)
+        tokens = tf.constant(words, dtype=tf.string)
+        ids = tf.range(vocabulary_size, dtype=tf.int64)
         tokens_to_ids_initializer = tf.lookup.KeyValueTensorInitializer(tokens, ids)
         ids_to_tokens_initializer = tf.lookup.KeyValueTensorInitializer(ids, tokens)
     if num_oov_buckets > 0:
@@ -287,3 +464,125 @@ def create_lookup_tables(
         tokens_to_ids = tf.lookup.StaticHashTable(tokens_to_ids_initializer, 0)
     ids_to_tokens = tf.lookup.StaticHashTable(ids_to_tokens_initializer, unk_token)
     return vocabulary_size + num_oov_buckets, tokens_to_ids, ids_to_tokens
+
+
+@functools.lru_cache(maxsize=4)
+def _load_vocabulary_words(path, mtime_nsec):
+    # The modification time is only part of the cache key.
+    return tuple(Vocab.from_file(path).words)
+
+
+def _count_vocabulary_lines(path):
+    with tf.io.gfile.GFile(path, mode="rb") as vocab:
+        data = vocab.read()
+    num_lines = data.count(b"\n")
+    if data and not data.endswith(b"\n"):
+        num_lines += 1
+    return num_lines
+
+
+class HashLookupTable(object):
+    """A lookup table that maps tokens to ids with a hash function."""
+
+    def __init__(self, num_buckets):
+        """Initializes the table.
+
+        Args:
+          num_buckets: Number of hash buckets.
+        """
+        self._num_buckets = num_buckets
+
+    def size(self):
+        """Returns the number of ids."""
+        return tf.constant(self._num_buckets, dtype=tf.int64)
+
+    def lookup(self, keys):
+        """Returns the ids of :obj:`keys`, a string tensor or ragged tensor."""
+        return tf.ragged.map_flat_values(
+            tf.strings.to_hash_bucket_fast, keys, self._num_buckets
+        )
+
+
+def create_hash_lookup_table(num_buckets):
+    """Creates a lookup table that hashes tokens to ids.
+
+    Unlike :func:`yimt.data.create_lookup_tables`, no vocabulary is required:
+    each token is mapped to one of :obj:`num_buckets` ids by a hash function.
+    The table is built instantly and its size does not depend on the number of
+    distinct tokens, but different tokens can collide and share the same id. The
+    number of buckets should be large compared to the number of frequent tokens
+    to keep collisions rare.
+
+    Args:
+      num_buckets: Number of hash buckets.
+
+    Returns:
+      A tuple containing,
+
+      - The number of ids.
+      - A :class:`yimt.data.HashLookupTable` mapping tokens to ids.
+    """
+    return num_buckets, HashLookupTable(num_buckets)
+
+
+class GatherLookupTable(object):
+    """A lookup table that maps ids to tokens by indexing a tensor of tokens."""
+
+    def __init__(self, tokens):
+        """Initializes the table.
+
+        Args:
+          tokens: The list of tokens, where the position of each token is its id.
+        """
+        self._tokens = tf.constant(tokens, dtype=tf.string)
+
+    def size(self):
+        """Returns the number of ids."""
+        return tf.size(self._tokens, out_type=tf.int64)
+
+    def lookup(self, ids):
+        """Returns the tokens of :obj:`ids`, an integer tensor."""
+        return tf.gather(self._tokens, ids)
+
+
+def create_ids_to_tokens_table(vocabulary_path, num_oov_buckets=1, unk_token=None):
+    """Creates a table mapping ids to tokens by gathering from a constant tensor.
+
+    Vocabulary ids are contiguous so they can directly index the tokens instead of
+    going through a hash table as in :func:`yimt.data.create_lookup_tables`. The
+    out-of-vocabulary ids are mapped to :obj:`unk_token`. The vocabulary content
+    is embedded in the graph.
+
+    Args:
+      vocabulary_path: Path to the vocabulary file.
+      num_oov_buckets: Number of out-of-vocabulary buckets.
+      unk_token: The out-of-vocabulary token. Defaults to ``<unk>``.
+
+    Returns:
+      A :class:`yimt.data.GatherLookupTable` mapping ids to tokens.
+    """
+    if unk_token is None:
+        unk_token = constants.UNKNOWN_TOKEN
+    words = _load_vocabulary_words(
+        vocabulary_path, tf.io.gfile.stat(vocabulary_path).mtime_nsec
+    )
+    return GatherLookupTable(list(words) + [unk_token] * num_oov_buckets)
+
+
+def get_token_id(vocabulary_path, token):
+    """Returns the id of a token in a vocabulary file.
+
+    Args:
+      vocabulary_path: Path to the vocabulary file.
+      token: The token to look up.
+
+    Returns:
+      The id of :obj:`token` or ``None`` if it is not in the vocabulary.
+    """
+    words = _load_vocabulary_words(
+        vocabulary_path, tf.io.gfile.stat(vocabulary_path).mtime_nsec
+    )
+    try:
+        return words.index(token)
+    except ValueError:
+        return None
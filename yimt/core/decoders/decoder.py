@@ -44,6 +44,7 @@ class Decoder(tf.keras.layers.Layer):
         self.output_layer_bias = output_layer_bias
         self.memory = None
         self.memory_sequence_length = None
+        self.memory_beam_size = None
         if vocab_size is not None or output_layer is not None:
             self.initialize(vocab_size=vocab_size, output_layer=output_layer)
 
@@ -53,6 +54,13 @@ class Decoder(tf.keras.layers.Layer):
         history."""
         return True
 
+    @property
+    def support_memory_broadcast(self):
+        """Returns ``True`` if the memory can have a smaller batch size than the
+        decoder state, e.g. when the memory is shared by all beams in beam search.
+        """
+        return False
+
     @property
     def initialized(self):
         """Returns ``True`` if this decoder is initialized."""
@@ -98,6 +106,7 @@ class Decoder(tf.keras.layers.Layer):
         initial_state=None,
         batch_size=None,
         dtype=None,
+        memory_beam_size=None,
     ):
         """Returns the initial decoder state.
 
@@ -108,6 +117,9 @@ class Decoder(tf.keras.layers.Layer):
             state.
           batch_size: The batch size to use.
           dtype: The dtype of the state.
+          memory_beam_size: If set, each memory entry is shared by this many
+            consecutive entries of the decoder batch, e.g. the memory is not tiled
+            for beam search. This requires :attr:`support_memory_broadcast`.
 
         Returns:
           A nested structure of tensors representing the decoder state.
@@ -123,6 +135,7 @@ class Decoder(tf.keras.layers.Layer):
         self._assert_memory_is_compatible(memory, memory_sequence_length)
         self.memory = memory
         self.memory_sequence_length = memory_sequence_length
+        self.memory_beam_size = memory_beam_size
         if batch_size is None or dtype is None:
             sentinel = tf.nest.flatten(memory)[0]
             if sentinel is None:
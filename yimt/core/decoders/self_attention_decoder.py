@@ -91,6 +91,7 @@ class SelfAttentionDecoder(decoder.Decoder):
         cache=None,
         memory=None,
         memory_sequence_length=None,
+        memory_beam_size=None,
         step=None,
         training=None,
     ):
@@ -138,6 +139,7 @@ class SelfAttentionDecoder(decoder.Decoder):
                 memory=memory,
                 memory_mask=memory_mask,
                 cache=cache[i] if cache is not None else None,
+                memory_beam_size=memory_beam_size,
                 training=training,
             )
             attention.append(layer_attention)
@@ -196,6 +198,7 @@ class SelfAttentionDecoder(decoder.Decoder):
             cache=state,
             memory=memory,
             memory_sequence_length=memory_sequence_length,
+            memory_beam_size=self.memory_beam_size,
             step=timestep,
             training=training,
         )
@@ -207,17 +210,31 @@ class SelfAttentionDecoder(decoder.Decoder):
     def _get_initial_state(self, batch_size, dtype, initial_state=None):
         # The decoder state contains the keys and values projections of the previous timesteps.
         _ = initial_state
+        if self.memory is not None:
+            # The memory can be shared by multiple beams and have a smaller batch size.
+            memory_batch_sizes = [
+                tf.shape(memory)[0] for memory in tf.nest.flatten(self.memory)
+            ]
+        else:
+            memory_batch_sizes = [batch_size] * self.num_sources
+        depth = self.num_units // self.num_heads
         cache = []
         for _ in self.layers:
-            shape = [batch_size, self.num_heads, 0, self.num_units // self.num_heads]
+            shape = [batch_size, self.num_heads, 0, depth]
             self_kv = (tf.zeros(shape, dtype=dtype), tf.zeros(shape, dtype=dtype))
-            memory_kv = [
-                (tf.zeros(shape, dtype=dtype), tf.zeros(shape, dtype=dtype))
-                for _ in range(self.num_sources)
-            ]
+            memory_kv = []
+            for memory_batch_size in memory_batch_sizes:
+                shape = [memory_batch_size, self.num_heads, 0, depth]
+                memory_kv.append(
+                    (tf.zeros(shape, dtype=dtype), tf.zeros(shape, dtype=dtype))
+                )
             cache.append(dict(self_kv=self_kv, memory_kv=memory_kv))
         return cache
 
+    @property
+    def support_memory_broadcast(self):
+        return True
+
     def _get_state_reorder_flags(self):
         # We don't need to reorder memory_kv as it is the same for all beams.
         return [
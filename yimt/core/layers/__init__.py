@@ -1,6 +1,13 @@
 """Module defining reusable and model specific layers."""
 
-from yimt.core.layers.common import Dense, LayerNorm, LayerWrapper, dropout, gelu
+from yimt.core.layers.common import (
+    AdaptiveSoftmax,
+    Dense,
+    LayerNorm,
+    LayerWrapper,
+    dropout,
+    gelu,
+)
 from yimt.core.layers.position import (
     PositionEmbedder,
     PositionEncoder,
@@ -23,5 +30,7 @@ from yimt.core.layers.transformer import (
     TransformerLayerWrapper,
     combine_heads,
     future_mask,
+    merge_beams_in_time,
+    split_beams_from_time,
     split_heads,
 )
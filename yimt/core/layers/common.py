@@ -88,6 +88,79 @@ class Dense(tf.keras.layers.Dense):
         return m
 
 
+class AdaptiveSoftmax(tf.keras.layers.Layer):
+    """Adaptive softmax output layer as described in
+    https://arxiv.org/abs/1609.04309.
+
+    The vocabulary is partitioned in a head containing the most frequent tokens
+    and tail clusters containing less frequent tokens. Each tail cluster is
+    represented by a single entry in the head softmax and its tokens are predicted
+    from a low-rank projection of the inputs.
+
+    This layer returns log probabilities over the full vocabulary so that it can
+    replace the decoder output layer: a (log) softmax applied on these values
+    returns the same distribution.
+
+    Note:
+      The vocabulary should be sorted by decreasing frequency.
+    """
+
+    def __init__(self, units, cutoffs, projection_factor=4, **kwargs):
+        """Initializes the layer.
+
+        Args:
+          units: The vocabulary size.
+          cutoffs: The increasing vocabulary indices at which each tail cluster
+            starts.
+          projection_factor: The projection dimension is divided by this factor
+            for each successive tail cluster.
+          kwargs: Additional layers arguments.
+
+        Raises:
+          ValueError: if :obj:`cutoffs` is not an increasing list of indices in
+            the range ``[1, units)``.
+        """
+        super().__init__(**kwargs)
+        cutoffs = list(cutoffs)
+        if (
+            not cutoffs
+            or cutoffs != sorted(set(cutoffs))
+            or cutoffs[0] <= 0
+            or cutoffs[-1] >= units
+        ):
+            raise ValueError(
+                "cutoffs should be an increasing list of indices between 1 and %d, "
+                "got %s" % (units - 1, cutoffs)
+            )
+        self.units = units
+        self.cutoffs = cutoffs
+        self.projection_factor = projection_factor
+        self.head = Dense(cutoffs[0] + len(cutoffs))
+        self.tail_projections = []
+        self.tail_outputs = []
+
+    def build(self, input_shape):
+        depth = input_shape[-1]
+        boundaries = self.cutoffs + [self.units]
+        for i in range(len(self.cutoffs)):
+            projection_size = max(depth // (self.projection_factor ** (i + 1)), 1)
+            self.tail_projections.append(Dense(projection_size, use_bias=False))
+            self.tail_outputs.append(Dense(boundaries[i + 1] - boundaries[i]))
+        super().build(input_shape)
+
+    def call(self, inputs):
+        head_size = self.cutoffs[0]
+        head_log_probs = tf.nn.log_softmax(self.head(inputs))
+        log_probs = [head_log_probs[..., :head_size]]
+        for i, (projection, output) in enumerate(
+            zip(self.tail_projections, self.tail_outputs)
+        ):
+            cluster_log_probs = head_log_probs[..., head_size + i : head_size + i + 1]
+            tail_log_probs = tf.nn.log_softmax(output(projection(inputs)))
+            log_probs.append(tail_log_probs + cluster_log_probs)
+        return tf.concat(log_probs, axis=-1)
+
+
 class LayerNorm(tf.keras.layers.LayerNormalization):
     """Layer normalization."""
 
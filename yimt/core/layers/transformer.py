@@ -55,6 +55,9 @@ def split_heads(inputs, num_heads):
       A ``tf.Tensor`` of shape :math:`[B, H, T, D / H]`.
     """
     shape = misc.shape_list(inputs)
+    if inputs.shape[1] == 1:
+        # With a single timestep (e.g. during decoding), the transpose is a reshape.
+        return tf.reshape(inputs, [shape[0], num_heads, 1, shape[2] // num_heads])
     outputs = tf.reshape(inputs, [shape[0], shape[1], num_heads, shape[2] // num_heads])
     outputs = tf.transpose(outputs, perm=[0, 2, 1, 3])
     return outputs
@@ -70,11 +73,49 @@ def combine_heads(inputs):
       A ``tf.Tensor`` of shape :math:`[B, T, D * H]`.
     """
     shape = misc.shape_list(inputs)
+    if inputs.shape[2] == 1:
+        return tf.reshape(inputs, [shape[0], 1, shape[1] * shape[3]])
     outputs = tf.transpose(inputs, perm=[0, 2, 1, 3])
     outputs = tf.reshape(outputs, [shape[0], shape[2], shape[1] * shape[3]])
     return outputs
 
 
+def merge_beams_in_time(inputs, beam_size):
+    """Packs the beams of each batch entry in the time dimension.
+
+    Args:
+      inputs: A ``tf.Tensor`` of shape :math:`[B * K, H, T, D]` where the beams
+        of a batch entry are contiguous.
+      beam_size: The number of beams :math:`K`.
+
+    Returns:
+      A ``tf.Tensor`` of shape :math:`[B, H, K * T, D]`.
+    """
+    shape = misc.shape_list(inputs)
+    outputs = tf.reshape(inputs, [-1, beam_size] + shape[1:])
+    outputs = tf.transpose(outputs, perm=[0, 2, 1, 3, 4])
+    return tf.reshape(outputs, [-1, shape[1], beam_size * shape[2], shape[3]])
+
+
+def split_beams_from_time(inputs, beam_size):
+    """Unpacks the beams from the time dimension. This is the inverse of
+    :func:`yimt.layers.merge_beams_in_time`.
+
+    Args:
+      inputs: A ``tf.Tensor`` of shape :math:`[B, H, K * T, D]`.
+      beam_size: The number of beams :math:`K`.
+
+    Returns:
+      A ``tf.Tensor`` of shape :math:`[B * K, H, T, D]`.
+    """
+    shape = misc.shape_list(inputs)
+    outputs = tf.reshape(
+        inputs, [shape[0], shape[1], beam_size, shape[2] // beam_size, shape[3]]
+    )
+    outputs = tf.transpose(outputs, perm=[0, 2, 1, 3, 4])
+    return tf.reshape(outputs, [-1, shape[1], shape[2] // beam_size, shape[3]])
+
+
 def relative_positions(length, maximum_position, with_cache=False):
     """Builds the relative positions.
 
@@ -273,7 +314,15 @@ class MultiHeadAttention(tf.keras.layers.Layer):
             )
         super().build(input_shape)
 
-    def call(self, inputs, memory=None, mask=None, cache=None, training=None):
+    def call(
+        self,
+        inputs,
+        memory=None,
+        mask=None,
+        cache=None,
+        memory_beam_size=None,
+        training=None,
+    ):
         """Runs the layer.
 
         Args:
@@ -284,6 +333,9 @@ class MultiHeadAttention(tf.keras.layers.Layer):
             :math:`[B, T_1, T_2]`.
           cache: An optional tuple containing projected keys and values from the
             previous step. Tensors of shape :math:`[B, H, T_2, D / H]`.
+          memory_beam_size: If set, each memory entry is shared by this many
+            consecutive queries, e.g. the memory is not tiled for beam search. The
+            memory batch size is then :math:`B` divided by this value.
           training: Run in training mode.
 
         Returns:
@@ -348,6 +400,19 @@ class MultiHeadAttention(tf.keras.layers.Layer):
 
         cache = (keys, values)
 
+        # When the memory is shared by all beams of a batch entry, the queries of
+        # all beams are packed in the time dimension so that the keys and values
+        # are broadcasted instead of replicated.
+        beam_size = None
+        if (
+            memory is not None
+            and memory_beam_size is not None
+            and memory_beam_size > 1
+            and not getattr(self, "_tflite_mode", False)
+        ):
+            beam_size = memory_beam_size
+            queries = merge_beams_in_time(queries, beam_size)
+
         # Dot product attention.
         dot = tf.matmul(queries, keys, transpose_b=True)
         if relative_repr_keys is not None:
@@ -370,6 +435,9 @@ class MultiHeadAttention(tf.keras.layers.Layer):
             heads += matmul_with_relative_representations(
                 drop_attn, relative_repr_values
             )
+        if beam_size is not None:
+            heads = split_beams_from_time(heads, beam_size)
+            attn = split_beams_from_time(attn, beam_size)
 
         # Concatenate all heads output.
         combined = combine_heads(heads)
@@ -551,6 +619,7 @@ class SelfAttentionDecoderLayer(tf.keras.layers.Layer):
         memory=None,
         memory_mask=None,
         cache=None,
+        memory_beam_size=None,
         training=None,
     ):
         """Runs the decoder layer."""
@@ -575,6 +644,7 @@ class SelfAttentionDecoderLayer(tf.keras.layers.Layer):
                     memory=mem,
                     mask=mem_mask,
                     cache=mem_cache,
+                    memory_beam_size=memory_beam_size,
                     training=training,
                 )
                 attention.append(attention_i)
@@ -326,6 +326,7 @@ class Model(tf.keras.layers.Layer):
                 schedule_step_duration=params.get("decay_step_duration", 1),
                 start_step=params.get("start_decay_steps", 0),
                 minimum_learning_rate=params.get("minimum_learning_rate", 0),
+                materialize_steps=params.get("materialize_decay_steps"),
             )
         optimizer_params = params.get("optimizer_params")
         if optimizer_params is None:
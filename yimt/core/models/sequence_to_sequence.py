@@ -1,10 +1,9 @@
 """Standard sequence-to-sequence model."""
 
 import tensorflow as tf
-import tensorflow_addons as tfa
 
-from yimt.core import inputters, config as config_util, constants
-from yimt.core.data import noise, text
+from yimt.core import inputters, config as config_util, constants, layers
+from yimt.core.data import noise, text, vocab
 from yimt.core.layers import reducer
 from yimt.core.models import model
 from yimt.core.utils import decoding, losses, misc
@@ -95,6 +94,12 @@ class SequenceToSequence(model.Model):
         self.encoder = encoder
         self.decoder = decoder
         self.share_embeddings = share_embeddings
+        self._jit_compiled_encoder = None
+        self._ids_to_tokens = None
+        self._unknown_id = None
+        self._decoding_noiser = None
+        self._decoding_strategy = None
+        self._sampler = None
 
     def auto_config(self, num_replicas=1):
         config = super().auto_config(num_replicas=num_replicas)
@@ -128,7 +133,34 @@ class SequenceToSequence(model.Model):
 
     def initialize(self, data_config, params=None):
         super().initialize(data_config, params=params)
-        self.decoder.initialize(vocab_size=self.labels_inputter.vocabulary_size)
+        vocab_size = self.labels_inputter.vocabulary_size
+        output_layer = None
+        adaptive_softmax_cutoffs = self.params.get("adaptive_softmax_cutoffs")
+        if adaptive_softmax_cutoffs:
+            if EmbeddingsSharingLevel.share_target_embeddings(self.share_embeddings):
+                raise ValueError(
+                    "adaptive_softmax_cutoffs is not compatible with sharing the "
+                    "target embeddings and softmax weights"
+                )
+            output_layer = layers.AdaptiveSoftmax(vocab_size, adaptive_softmax_cutoffs)
+        self.decoder.initialize(vocab_size=vocab_size, output_layer=output_layer)
+        # Decoded ids are dense so they can be converted to tokens with a simple
+        # gather, but this embeds the target vocabulary in the graph. When the
+        # vocabularies are exported as assets, the inputter table is used instead.
+        if data_config.get("export_vocabulary_assets", True):
+            self._ids_to_tokens = None
+        else:
+            self._ids_to_tokens = vocab.create_ids_to_tokens_table(
+                self.labels_inputter.vocabulary_file,
+                num_oov_buckets=self.labels_inputter.num_oov_buckets,
+            )
+        # The vocabulary may also contain the unknown token as a regular entry.
+        self._unknown_id = vocab.get_token_id(
+            self.labels_inputter.vocabulary_file, constants.UNKNOWN_TOKEN
+        )
+        # The decoding parameters are only set on initialization.
+        self._decoding_strategy = decoding.DecodingStrategy.from_params(self.params)
+        self._sampler = decoding.Sampler.from_params(self.params)
         if self.params.get("contrastive_learning"):
             # Use the simplest and most effective CL_one from the paper.
             # https://www.aclweb.org/anthology/P19-1623
@@ -138,6 +170,15 @@ class SequenceToSequence(model.Model):
                 is_spacer=self.params.get("decoding_subword_token_is_spacer"),
             )
             self.labels_inputter.set_noise(noiser, in_place=False)
+        decoding_noise = self.params.get("decoding_noise")
+        if decoding_noise:
+            self._decoding_noiser = _make_noiser(
+                decoding_noise,
+                self.params.get("decoding_subword_token", "￭"),
+                self.params.get("decoding_subword_token_is_spacer"),
+            )
+        else:
+            self._decoding_noiser = None
 
     def build(self, input_shape):
         super().build(input_shape)
@@ -148,8 +189,11 @@ class SequenceToSequence(model.Model):
         # Encode the source.
         source_length = self.features_inputter.get_length(features)
         source_inputs = self.features_inputter(features, training=training)
-        encoder_outputs, encoder_state, encoder_sequence_length = self.encoder(
-            source_inputs, sequence_length=source_length, training=training
+        encoder_outputs, encoder_state, encoder_sequence_length = self._encode(
+            source_inputs,
+            source_length,
+            inference=labels is None and not training,
+            training=training,
         )
 
         outputs = None
@@ -174,14 +218,38 @@ class SequenceToSequence(model.Model):
 
         return outputs, predictions
 
+    def _encode(self, source_inputs, source_length, inference=False, training=None):
+        # The compiled encoder is only used for inference: evaluation batches are
+        # not bucketized for inference and would trigger more recompilations.
+        if (
+            not inference
+            or self.tflite_mode
+            or not self.params.get("jit_compile_encoder")
+        ):
+            return self.encoder(
+                source_inputs, sequence_length=source_length, training=training
+            )
+
+        # The encoder is a pure tensor function so XLA can fuse its many small ops.
+        # The decoding loop is kept outside the compiled region: it operates on
+        # dynamic shapes and string tensors that XLA does not support.
+        if self._jit_compiled_encoder is None:
+            self._jit_compiled_encoder = tf.function(self.encoder, jit_compile=True)
+        return self._jit_compiled_encoder(
+            source_inputs, sequence_length=source_length, training=training
+        )
+
     def serve_function(self):
         if self.tflite_mode:
 
             # The serving function for TensorFlow Lite is simplified to only accept
-            # a single sequence of ids.
+            # a single sequence of ids. When an input size is set, the ids should be
+            # padded with 0 to this size but all tensor shapes are then static.
+            input_size = self.params.get("tflite_input_size")
+
             @tf.function(
                 input_signature=[
-                    tf.TensorSpec([None], dtype=tf.dtypes.int32, name="ids")
+                    tf.TensorSpec([input_size], dtype=tf.dtypes.int32, name="ids")
                 ]
             )
             def _run(ids):
@@ -209,10 +277,40 @@ class SequenceToSequence(model.Model):
     ):
         params = self.params
         target_inputs = self.labels_inputter(labels, training=training)
+        target_length = self.labels_inputter.get_length(labels)
         input_fn = lambda ids: self.labels_inputter({"ids": ids}, training=training)
 
         sampling_probability = None
 
+        noisy_ids = labels.get("noisy_ids")
+        contrastive_learning = noisy_ids is not None and params.get(
+            "contrastive_learning"
+        )
+        if contrastive_learning:
+            # In case of contrastive learning, also forward the erroneous
+            # translation to compute its log likelihood later. Both targets are
+            # decoded in a single batch: the shortest one is padded in time, which
+            # does not change the outputs of its valid positions.
+            noisy_inputs = self.labels_inputter({"ids": noisy_ids}, training=training)
+            noisy_length = labels["noisy_length"]
+            target_time = tf.shape(target_inputs)[1]
+            noisy_time = tf.shape(noisy_inputs)[1]
+            max_time = tf.maximum(target_time, noisy_time)
+            target_inputs = tf.concat(
+                [
+                    reducer.pad_in_time(target_inputs, max_time - target_time),
+                    reducer.pad_in_time(noisy_inputs, max_time - noisy_time),
+                ],
+                0,
+            )
+            target_length = tf.concat([target_length, noisy_length], 0)
+            encoder_outputs, encoder_state, encoder_sequence_length = [
+                tf.nest.map_structure(
+                    lambda x: tf.concat([x, x], 0) if x is not None else None, value
+                )
+                for value in (encoder_outputs, encoder_state, encoder_sequence_length)
+            ]
+
         initial_state = self.decoder.initial_state(
             memory=encoder_outputs,
             memory_sequence_length=encoder_sequence_length,
@@ -220,29 +318,24 @@ class SequenceToSequence(model.Model):
         )
         logits, _, attention = self.decoder(
             target_inputs,
-            self.labels_inputter.get_length(labels),
+            target_length,
             state=initial_state,
             input_fn=input_fn,
             sampling_probability=sampling_probability,
             training=training,
         )
-        outputs = dict(logits=logits, attention=attention)
 
-        noisy_ids = labels.get("noisy_ids")
-        if noisy_ids is not None and params.get("contrastive_learning"):
-            # In case of contrastive learning, also forward the erroneous
-            # translation to compute its log likelihood later.
-            noisy_inputs = self.labels_inputter({"ids": noisy_ids}, training=training)
-            noisy_logits, _, _ = self.decoder(
-                noisy_inputs,
-                labels["noisy_length"],
-                state=initial_state,
-                input_fn=input_fn,
-                sampling_probability=sampling_probability,
-                training=training,
-            )
-            outputs["noisy_logits"] = noisy_logits
-        return outputs
+        if not contrastive_learning:
+            return dict(logits=logits, attention=attention)
+
+        logits, noisy_logits = tf.split(logits, 2)
+        if attention is not None:
+            attention = tf.split(attention, 2)[0][:, :target_time]
+        return dict(
+            logits=logits[:, :target_time],
+            attention=attention,
+            noisy_logits=noisy_logits[:, :noisy_time],
+        )
 
     def _dynamic_decode(
         self,
@@ -252,28 +345,34 @@ class SequenceToSequence(model.Model):
         encoder_sequence_length,
     ):
         params = self.params
-        batch_size = tf.shape(tf.nest.flatten(encoder_outputs)[0])[0]
+        # The batch size is read from the source length so that the decoding
+        # inputs do not depend on the encoder and can be prepared concurrently.
+        source_length = self.features_inputter.get_length(features)
+        batch_size = tf.shape(tf.nest.flatten(source_length)[0])[0]
         start_ids = tf.fill([batch_size], constants.START_OF_SENTENCE_ID)
         beam_size = params.get("beam_width", 1)
 
+        decoder_batch_size = None
+        memory_beam_size = None
         if beam_size > 1:
-            # Tile encoder outputs to prepare for beam search.
-            encoder_outputs = tfa.seq2seq.tile_batch(encoder_outputs, beam_size)
-            encoder_sequence_length = tfa.seq2seq.tile_batch(
-                encoder_sequence_length, beam_size
-            )
-            encoder_state = tf.nest.map_structure(
-                lambda state: tfa.seq2seq.tile_batch(state, beam_size)
-                if state is not None
-                else None,
-                encoder_state,
-            )
+            if self.decoder.support_memory_broadcast and not self.tflite_mode:
+                # The encoder outputs are shared by all beams and are not tiled.
+                decoder_batch_size = batch_size * beam_size
+                memory_beam_size = beam_size
+            else:
+                # Tile encoder outputs to prepare for beam search.
+                encoder_outputs, encoder_state, encoder_sequence_length = _tile_batch(
+                    (encoder_outputs, encoder_state, encoder_sequence_length),
+                    beam_size,
+                )
 
         # Dynamically decodes from the encoder outputs.
         initial_state = self.decoder.initial_state(
             memory=encoder_outputs,
             memory_sequence_length=encoder_sequence_length,
             initial_state=encoder_state,
+            batch_size=decoder_batch_size,
+            memory_beam_size=memory_beam_size,
         )
         (
             sampled_ids,
@@ -282,13 +381,19 @@ class SequenceToSequence(model.Model):
             alignment,
             _,
         ) = self.decoder.dynamic_decode(
-            self.labels_inputter,
+            # Outside TensorFlow Lite, the target embedding layer is only a lookup
+            # during inference so we directly gather from the embedding matrix.
+            self.labels_inputter
+            if self.tflite_mode
+            else self.labels_inputter.embedding,
             start_ids,
             initial_state=initial_state,
             decoding_strategy=decoding.DecodingStrategy.from_params(
-                params, tflite_mode=self.tflite_mode
-            ),
-            sampler=decoding.Sampler.from_params(params),
+                params, tflite_mode=True
+            )
+            if self.tflite_mode
+            else self._decoding_strategy,
+            sampler=self._sampler,
             maximum_iterations=params.get("maximum_decoding_length", 250),
             minimum_iterations=params.get("minimum_decoding_length", 0),
             tflite_output_size=params.get("tflite_output_size", 250)
@@ -296,12 +401,36 @@ class SequenceToSequence(model.Model):
             else None,
         )
 
+        num_hypotheses = beam_size
         if self.tflite_mode:
             target_tokens = sampled_ids
         else:
-            target_tokens = self.labels_inputter.ids_to_tokens.lookup(
-                tf.cast(sampled_ids, tf.int64)
-            )
+            # Set the static beam dimension to help shape inference in the
+            # post-processing ops.
+            sampled_ids = tf.ensure_shape(sampled_ids, [None, beam_size, None])
+            sampled_length = tf.ensure_shape(sampled_length, [None, beam_size])
+            log_probs = tf.ensure_shape(log_probs, [None, beam_size])
+            if alignment is not None:
+                alignment = tf.ensure_shape(alignment, [None, beam_size, None, None])
+
+            # Maybe restrict the number of returned hypotheses based on the user
+            # parameter. This is done before post-processing the hypotheses.
+            num_hypotheses = params.get("num_hypotheses", 1)
+            if num_hypotheses > beam_size:
+                raise ValueError("n_best cannot be greater than beam_width")
+            if num_hypotheses > 0 and num_hypotheses < beam_size:
+                sampled_ids, sampled_length, log_probs, alignment = [
+                    value[:, :num_hypotheses] if value is not None else None
+                    for value in (sampled_ids, sampled_length, log_probs, alignment)
+                ]
+            else:
+                num_hypotheses = beam_size
+            if self._ids_to_tokens is not None:
+                target_tokens = self._ids_to_tokens.lookup(sampled_ids)
+            else:
+                target_tokens = self.labels_inputter.ids_to_tokens.lookup(
+                    tf.cast(sampled_ids, tf.int64)
+                )
         # Maybe replace unknown targets by the source tokens with the highest attention weight.
         if params.get("replace_unknown_target", False):
             if alignment is None:
@@ -319,18 +448,35 @@ class SequenceToSequence(model.Model):
             source_length = self.features_inputter.get_length(
                 features, ignore_special_tokens=True
             )
-            if beam_size > 1:
-                source_tokens = tfa.seq2seq.tile_batch(source_tokens, beam_size)
-                source_length = tfa.seq2seq.tile_batch(source_length, beam_size)
-            original_shape = tf.shape(target_tokens)
+            if num_hypotheses > 1:
+                source_tokens, source_length = _tile_batch(
+                    (source_tokens, source_length), num_hypotheses
+                )
             if self.tflite_mode:
                 target_tokens = tf.squeeze(target_tokens, axis=0)
-                output_size = original_shape[-1]
+                output_size = tf.shape(target_tokens)[-1]
                 unknown_token = self.labels_inputter.vocabulary_size - 1
             else:
-                target_tokens = tf.reshape(target_tokens, [-1, original_shape[-1]])
+                # The hypotheses dimension is known so the batch dimensions can be
+                # merged and split without reading the dynamic shape.
+                target_tokens = tf.reshape(
+                    target_tokens, [batch_size * num_hypotheses, -1]
+                )
                 output_size = tf.shape(target_tokens)[1]
-                unknown_token = constants.UNKNOWN_TOKEN
+                # Unknown tokens are found from the ids which is cheaper than
+                # comparing strings: all OOV buckets are at the end of the vocabulary.
+                first_unknown_id = (
+                    self.labels_inputter.vocabulary_size
+                    - self.labels_inputter.num_oov_buckets
+                )
+                unknown_mask = tf.greater_equal(sampled_ids, first_unknown_id)
+                if self._unknown_id is not None:
+                    unknown_mask = tf.logical_or(
+                        unknown_mask, tf.equal(sampled_ids, self._unknown_id)
+                    )
+                unknown_mask = tf.reshape(
+                    unknown_mask, [batch_size * num_hypotheses, -1]
+                )
 
             align_shape = misc.shape_list(alignment)
             attention = tf.reshape(
@@ -347,13 +493,19 @@ class SequenceToSequence(model.Model):
                     self.features_inputter.mark_end,
                 )
 
-            replaced_target_tokens = replace_unknown_target(
-                target_tokens, source_tokens, attention, unknown_token=unknown_token
-            )
             if self.tflite_mode:
-                target_tokens = replaced_target_tokens
+                target_tokens = replace_unknown_target(
+                    target_tokens, source_tokens, attention, unknown_token=unknown_token
+                )
             else:
-                target_tokens = tf.reshape(replaced_target_tokens, original_shape)
+                replaced_target_tokens = tf.where(
+                    unknown_mask,
+                    align_tokens_from_attention(source_tokens, attention),
+                    target_tokens,
+                )
+                target_tokens = tf.reshape(
+                    replaced_target_tokens, [batch_size, num_hypotheses, -1]
+                )
 
         if self.tflite_mode:
             if beam_size > 1:
@@ -363,37 +515,30 @@ class SequenceToSequence(model.Model):
 
             return target_tokens
         # Maybe add noise to the predictions.
-        decoding_noise = params.get("decoding_noise")
-        if decoding_noise:
-            target_tokens, sampled_length = _add_noise(
-                target_tokens,
-                sampled_length,
-                decoding_noise,
-                params.get("decoding_subword_token", "￭"),
-                params.get("decoding_subword_token_is_spacer"),
-            )
+        if self._decoding_noiser is not None:
+            # The noise is applied on strings which are only supported on CPU.
+            with tf.device("/cpu:0"):
+                target_tokens, sampled_length = self._decoding_noiser(
+                    target_tokens, sampled_length, keep_shape=True
+                )
             alignment = None  # Invalidate alignments.
 
         predictions = {"log_probs": log_probs}
         if self.labels_inputter.tokenizer.in_graph:
             detokenized_text = self.labels_inputter.tokenizer.detokenize(
-                tf.reshape(target_tokens, [batch_size * beam_size, -1]),
-                sequence_length=tf.reshape(sampled_length, [batch_size * beam_size]),
+                tf.reshape(target_tokens, [batch_size * num_hypotheses, -1]),
+                sequence_length=tf.reshape(
+                    sampled_length, [batch_size * num_hypotheses]
+                ),
+            )
+            predictions["text"] = tf.reshape(
+                detokenized_text, [batch_size, num_hypotheses]
             )
-            predictions["text"] = tf.reshape(detokenized_text, [batch_size, beam_size])
         else:
             predictions["tokens"] = target_tokens
             predictions["length"] = sampled_length
             if alignment is not None:
                 predictions["alignment"] = alignment
-
-        # Maybe restrict the number of returned hypotheses based on the user parameter.
-        num_hypotheses = params.get("num_hypotheses", 1)
-        if num_hypotheses > 0:
-            if num_hypotheses > beam_size:
-                raise ValueError("n_best cannot be greater than beam_width")
-            for key, value in predictions.items():
-                predictions[key] = value[:, :num_hypotheses]
         return predictions
 
     def compute_loss(self, outputs, labels, training=True):
@@ -458,28 +603,41 @@ class SequenceToSequence(model.Model):
                 "with_alignments is set but the model did not return alignment information"
             )
         num_hypotheses = params.get("n_best", len(prediction["log_probs"]))
-        outputs = []
-        for i in range(num_hypotheses):
-            if "tokens" in prediction:
-                target_length = prediction["length"][i]
-                tokens = prediction["tokens"][i][:target_length]
-                sentence = self.labels_inputter.tokenizer.detokenize(tokens)
-            else:
-                sentence = prediction["text"][i].decode("utf-8")
-            score = None
-            attention = None
-            if with_scores:
-                score = prediction["log_probs"][i]
-            if alignment_type:
-                attention = prediction["alignment"][i][:target_length]
-            sentence = misc.format_translation_output(
+
+        # Slice each prediction field once and iterate over them in parallel.
+        no_values = [None] * num_hypotheses
+        if "tokens" in prediction:
+            lengths = prediction["length"][:num_hypotheses]
+            # Detokenize all hypotheses with a single tokenizer call.
+            sentences = self.labels_inputter.tokenizer.detokenize(
+                [
+                    list(tokens[:length])
+                    for tokens, length in zip(prediction["tokens"], lengths)
+                ]
+            )
+        else:
+            lengths = no_values
+            sentences = [
+                text.decode("utf-8") for text in prediction["text"][:num_hypotheses]
+            ]
+        scores = prediction["log_probs"][:num_hypotheses] if with_scores else no_values
+        if alignment_type:
+            attentions = [
+                attention[:length]
+                for attention, length in zip(prediction["alignment"], lengths)
+            ]
+        else:
+            attentions = no_values
+
+        return [
+            misc.format_translation_output(
                 sentence,
                 score=score,
                 attention=attention,
                 alignment_type=alignment_type,
             )
-            outputs.append(sentence)
-        return outputs
+            for sentence, score, attention in zip(sentences, scores, attentions)
+        ]
 
 
 class SequenceToSequenceInputter(inputters.ExampleInputter):
@@ -520,12 +678,14 @@ def mask_attention(attention, source_length, source_has_bos, source_has_eos):
     """
     if not source_has_bos and not source_has_eos:
         return attention
+    attention = tf.convert_to_tensor(attention)
     if source_has_bos:
+        # The BOS column is moved last where it is always masked.
         attention = tf.roll(attention, shift=-1, axis=-1)
     source_mask = tf.sequence_mask(
-        source_length, maxlen=tf.shape(attention)[-1], dtype=attention.dtype
+        source_length, maxlen=misc.shape_list(attention)[-1], dtype=attention.dtype
     )
-    return attention * tf.expand_dims(source_mask, 1)
+    return attention * source_mask[:, tf.newaxis, :]
 
 
 def align_tokens_from_attention(tokens, attention):
@@ -566,7 +726,19 @@ def replace_unknown_target(
     )
 
 
-def _add_noise(tokens, lengths, params, subword_token, is_spacer=None):
+def _tile_batch(structure, multiplier):
+    """Repeats each batch entry of a nested structure :obj:`multiplier` times.
+
+    This is equivalent to ``tfa.seq2seq.tile_batch`` applied on each tensor, but
+    the structure is traversed once and ``None`` values are preserved.
+    """
+    return tf.nest.map_structure(
+        lambda t: tf.repeat(t, multiplier, axis=0) if t is not None else None,
+        structure,
+    )
+
+
+def _make_noiser(params, subword_token, is_spacer=None):
     if not isinstance(params, list):
         raise ValueError("Expected a list of noise modules")
     noises = []
@@ -584,7 +756,6 @@ def _add_noise(tokens, lengths, params, subword_token, is_spacer=None):
         else:
             raise ValueError("Invalid noise type: %s" % noise_type)
         noises.append(noise_class(*args))
-    noiser = noise.WordNoiser(
+    return noise.WordNoiser(
         noises=noises, subword_token=subword_token, is_spacer=is_spacer
     )
-    return noiser(tokens, lengths, keep_shape=True)
@@ -2,6 +2,7 @@ from yimt.core.optimizers.utils import make_optimizer, register_optimizer
 
 from yimt.core.optimizers.lr_schedules import (
     CosineAnnealing,
+    CosineRsqrtDecay,
     InvSqrtDecay,
     NoamDecay,
     RsqrtDecay,
@@ -1,5 +1,6 @@
 """Define learning rate decay functions."""
 
+import functools
 import inspect
 
 import numpy as np
@@ -14,6 +15,7 @@ _LR_SCHEDULES_REGISTRY = misc.ClassRegistry(
 register_learning_rate_schedule = _LR_SCHEDULES_REGISTRY.register
 
 
+@functools.lru_cache(maxsize=None)
 def get_lr_schedule_class(name):
     """Returns the learning rate schedule class.
 
@@ -36,6 +38,11 @@ def get_lr_schedule_class(name):
     return schedule_class
 
 
+@functools.lru_cache(maxsize=None)
+def _get_arguments(schedule_class):
+    return tuple(inspect.getfullargspec(schedule_class)[0])
+
+
 def make_learning_rate_schedule(
     initial_learning_rate,
     schedule_type,
@@ -43,6 +50,8 @@ def make_learning_rate_schedule(
     schedule_step_duration=1,
     start_step=0,
     minimum_learning_rate=0,
+    materialize_steps=None,
+    jit_compile=None,
 ):
     """Creates the learning rate schedule.
 
@@ -55,6 +64,10 @@ def make_learning_rate_schedule(
       schedule_step_duration: The number of training steps that make 1 schedule step.
       start_step: Start the schedule after this many steps.
       minimum_learning_rate: Do not decay past this learning rate value.
+      materialize_steps: If set, precompute the learning rate of this many training
+        steps. See :meth:`yimt.schedules.ScheduleWrapper.materialize`.
+      jit_compile: Compile the schedule with XLA. If ``None``, only the schedules
+        defined in :mod:`yimt.schedules` are compiled.
 
     Returns:
       A ``tf.keras.optimizers.schedules.LearningRateSchedule`` instance.
@@ -66,19 +79,31 @@ def make_learning_rate_schedule(
     See Also:
       :class:`yimt.schedules.ScheduleWrapper`
     """
-    if schedule_params is None:
-        schedule_params = {}
+    # Copy the parameters to not modify the user configuration.
+    schedule_params = dict(schedule_params or {})
     schedule_class = get_lr_schedule_class(schedule_type)
-    first_arg = inspect.getfullargspec(schedule_class)[0][1]
+    arguments = _get_arguments(schedule_class)
+    first_arg = arguments[1]
     if first_arg not in schedule_params:
         schedule_params[first_arg] = initial_learning_rate
+    # Schedules that accept a 1-indexed step let the wrapper prepare it.
+    if "one_indexed" in arguments:
+        schedule_params.setdefault("one_indexed", True)
     schedule = schedule_class(**schedule_params)
     schedule = ScheduleWrapper(
         schedule,
         step_start=start_step,
         step_duration=schedule_step_duration,
         minimum_learning_rate=minimum_learning_rate,
+        one_indexed=schedule_params.get("one_indexed", False),
+        jit_compile=jit_compile,
     )
+    if materialize_steps:
+        schedule.materialize(materialize_steps)
+    if tf.executing_eagerly():
+        # Trace and compile the schedule now so that the first training step
+        # does not include this latency.
+        schedule(0)
     return schedule
 
 
@@ -86,7 +111,13 @@ class ScheduleWrapper(tf.keras.optimizers.schedules.LearningRateSchedule):
     """Wrapper to augment a learning rate scheduler behavior."""
 
     def __init__(
-        self, schedule, step_start=0, step_duration=1, minimum_learning_rate=0
+        self,
+        schedule,
+        step_start=0,
+        step_duration=1,
+        minimum_learning_rate=0,
+        one_indexed=False,
+        jit_compile=None,
     ):
         """Initializes the decay function.
 
@@ -95,6 +126,11 @@ class ScheduleWrapper(tf.keras.optimizers.schedules.LearningRateSchedule):
           step_duration: The number of training steps that make 1 decay step.
           start_step: Start decay after this many steps.
           minimum_learning_rate: Do not decay past this learning rate value.
+          one_indexed: If ``True``, the wrapped schedule is called with the
+            1-indexed decay step as a ``tf.float32`` tensor.
+          jit_compile: Compile the schedule with XLA. If ``None``, only the schedules
+            defined in :mod:`yimt.schedules` are compiled since other schedules
+            may use operations that XLA does not support.
 
         See Also:
           :class:`yimt.schedules.make_learning_rate_schedule`
@@ -103,37 +139,139 @@ class ScheduleWrapper(tf.keras.optimizers.schedules.LearningRateSchedule):
         self.step_start = step_start
         self.step_duration = step_duration
         self.minimum_learning_rate = minimum_learning_rate
+        self.one_indexed = one_indexed
+        if jit_compile is None:
+            jit_compile = type(schedule).__module__ == __name__
+        self.jit_compile = jit_compile
+        # Convert the parameters once to match the types used in the schedule.
+        self._step_start = tf.constant(int(step_start), dtype=tf.int64)
+        self._step_duration = tf.constant(int(step_duration), dtype=tf.int64)
+        self._minimum_learning_rate = tf.constant(
+            minimum_learning_rate, dtype=tf.float32
+        )
+        # Learning rate schedules are non-negative so the minimum is only applied
+        # when it is positive.
+        self._apply_min = minimum_learning_rate > 0
+        self._table = None
+        self._lookup = None
+        # The schedule is a small scalar computation that XLA compiles into a single
+        # kernel.
+        self._call = tf.function(
+            self._compute,
+            input_signature=(tf.TensorSpec([], dtype=tf.int64),),
+            jit_compile=jit_compile,
+        )
 
     def __call__(self, step):
+        # The step is cast to a fixed type so that the schedule is only traced once,
+        # whether it is called by the optimizer (with a float step) or with Python
+        # values when reporting the learning rate.
+        step = tf.cast(step, tf.int64)
+        if self._lookup is not None:
+            return self._lookup(step)
+        return self._call(step)
+
+    def materialize(self, num_steps):
+        """Precomputes the learning rate of the first training steps.
+
+        The learning rate of these steps is then read from a table instead of
+        being computed. The learning rate of the following steps is still computed.
+        This method should be called before the schedule is used in a
+        ``tf.function``, e.g. before the first training step.
+
+        Args:
+          num_steps: The number of training steps to precompute, for example the
+            maximum number of training steps.
+        """
+        self._table = self.evaluate_range(0, num_steps)
+        self._lookup = tf.function(
+            self._lookup_table,
+            input_signature=(tf.TensorSpec([], dtype=tf.int64),),
+            jit_compile=self.jit_compile,
+        )
+
+    def evaluate_range(self, start, end):
+        """Evaluates the learning rate for a range of training steps at once.
+
+        Args:
+          start: The first training step.
+          end: The training step after the last one.
+
+        Returns:
+          A 1-D ``tf.Tensor`` with the learning rate of each step in the range.
+        """
+        steps = tf.range(start, end, dtype=tf.int64)
+        return tf.vectorized_map(self._compute, steps)
+
+    def _lookup_table(self, step):
+        # The table is kept 1-D so that the lookup is a gather on the first axis,
+        # which is cheap compared to gathers on inner axes or transposes.
+        return tf.cond(
+            step < tf.size(self._table, out_type=tf.int64),
+            true_fn=lambda: tf.gather(self._table, step),
+            false_fn=lambda: self._compute(step),
+        )
+
+    def _compute(self, step):
         # Map the training step to a decay step.
-        step = tf.maximum(step - self.step_start, 0)
-        step //= self.step_duration
-        learning_rate = self.schedule(step)
-        return tf.maximum(learning_rate, self.minimum_learning_rate)
+        step = tf.maximum(step - self._step_start, 0)
+        step //= self._step_duration
+        if self.one_indexed:
+            step = tf.cast(step + 1, tf.float32)
+        # The wrapped schedule may return a Python value but a tensor should be
+        # returned to the optimizer.
+        learning_rate = tf.convert_to_tensor(self.schedule(step))
+        if not self._apply_min:
+            return learning_rate
+        return tf.maximum(
+            learning_rate, tf.cast(self._minimum_learning_rate, learning_rate.dtype)
+        )
 
 
 @register_learning_rate_schedule
 class NoamDecay(tf.keras.optimizers.schedules.LearningRateSchedule):
     """Defines the decay function described in https://arxiv.org/abs/1706.03762."""
 
-    def __init__(self, scale, model_dim, warmup_steps):
+    def __init__(self, scale, model_dim, warmup_steps, one_indexed=False):
         """Initializes the decay function.
 
         Args:
           scale: The scale constant.
           model_dim: The model dimension.
           warmup_steps: The number of warmup steps.
+          one_indexed: If ``True``, the schedule expects a 1-indexed
+            ``tf.float32`` step, as passed by
+            :class:`yimt.schedules.ScheduleWrapper` with ``one_indexed=True``.
         """
+        self.one_indexed = one_indexed
         self.scale = tf.cast(scale, tf.float32)
         self.model_dim = tf.cast(model_dim, tf.float32)
         self.warmup_steps = tf.cast(warmup_steps, tf.float32)
+        # Precompute the constant factors of the schedule.
+        self._dim_factor = self.scale * tf.math.rsqrt(self.model_dim)
+        self._warmup_factor = tf.pow(self.warmup_steps, -1.5)
 
     def __call__(self, step):
-        step = tf.cast(step + 1, tf.float32)
-        return (
-            self.scale
-            * tf.pow(self.model_dim, -0.5)
-            * tf.minimum(tf.pow(step, -0.5), step * tf.pow(self.warmup_steps, -1.5))
+        if not self.one_indexed:
+            step = tf.cast(step + 1, tf.float32)
+        return self._dim_factor * tf.minimum(
+            tf.math.rsqrt(step), step * self._warmup_factor
+        )
+
+    def as_numpy(self, steps):
+        """Evaluates the schedule with NumPy, e.g. for offline analysis.
+
+        Args:
+          steps: A NumPy array of steps.
+
+        Returns:
+          A NumPy array with the learning rate of each step.
+        """
+        steps = np.asarray(steps, dtype=np.float32)
+        if not self.one_indexed:
+            steps += 1
+        return float(self._dim_factor) * np.minimum(
+            steps**-0.5, steps * float(self._warmup_factor)
         )
 
 
@@ -165,6 +303,18 @@ class RsqrtDecay(tf.keras.optimizers.schedules.LearningRateSchedule):
         step = tf.cast(step, tf.float32)
         return self.scale * tf.math.rsqrt(tf.maximum(step, self.warmup_steps))
 
+    def as_numpy(self, steps):
+        """Evaluates the schedule with NumPy, e.g. for offline analysis.
+
+        Args:
+          steps: A NumPy array of steps.
+
+        Returns:
+          A NumPy array with the learning rate of each step.
+        """
+        steps = np.asarray(steps, dtype=np.float32)
+        return float(self.scale) / np.sqrt(np.maximum(steps, float(self.warmup_steps)))
+
 
 @register_learning_rate_schedule
 class InvSqrtDecay(tf.keras.optimizers.schedules.LearningRateSchedule):
@@ -193,32 +343,57 @@ class InvSqrtDecay(tf.keras.optimizers.schedules.LearningRateSchedule):
       - :class:`yimt.schedules.RsqrtDecay`
     """
 
-    def __init__(self, learning_rate, warmup_steps, initial_learning_rate=0):
+    def __init__(
+        self, learning_rate, warmup_steps, initial_learning_rate=0, one_indexed=False
+    ):
         """Initializes the decay function.
 
         Args:
           learning_rate: The base learning rate.
           warmup_steps: The number of warmup steps.
           initial_learning_rate: Initial learning rate during warmup.
+          one_indexed: If ``True``, the schedule expects a 1-indexed
+            ``tf.float32`` step, as passed by
+            :class:`yimt.schedules.ScheduleWrapper` with ``one_indexed=True``.
         """
+        self.one_indexed = one_indexed
         self.lr = tf.cast(learning_rate, tf.float32)
         self.init_lr = tf.cast(initial_learning_rate, tf.float32)
         self.warmup_steps = tf.cast(warmup_steps, tf.float32)
 
     def __call__(self, step):
-        step = tf.cast(step + 1, tf.float32)
+        if not self.one_indexed:
+            step = tf.cast(step + 1, tf.float32)
+        # Both phases are computed and selected without control flow. The step is
+        # clipped so that each expression stays finite outside of its phase.
+        warmup = self.init_lr + (self.lr - self.init_lr) * (
+            tf.minimum(step, self.warmup_steps) / self.warmup_steps
+        )
+        after_warmup = self.lr * tf.math.sqrt(
+            self.warmup_steps / tf.maximum(step, self.warmup_steps)
+        )
+        return tf.where(step <= self.warmup_steps, warmup, after_warmup)
 
-        def _warmup():
-            return self.init_lr + (self.lr - self.init_lr) * (step / self.warmup_steps)
+    def as_numpy(self, steps):
+        """Evaluates the schedule with NumPy, e.g. for offline analysis.
 
-        def _after_warmup():
-            return self.lr * tf.math.sqrt(self.warmup_steps / step)
+        Args:
+          steps: A NumPy array of steps.
 
-        return tf.cond(
-            step <= self.warmup_steps,
-            true_fn=_warmup,
-            false_fn=_after_warmup,
+        Returns:
+          A NumPy array with the learning rate of each step.
+        """
+        steps = np.asarray(steps, dtype=np.float32)
+        if not self.one_indexed:
+            steps += 1
+        lr = float(self.lr)
+        init_lr = float(self.init_lr)
+        warmup_steps = float(self.warmup_steps)
+        warmup = init_lr + (lr - init_lr) * (
+            np.minimum(steps, warmup_steps) / warmup_steps
         )
+        after_warmup = lr * np.sqrt(warmup_steps / np.maximum(steps, warmup_steps))
+        return np.where(steps <= warmup_steps, warmup, after_warmup)
 
 
 @register_learning_rate_schedule
@@ -241,19 +416,193 @@ class CosineAnnealing(tf.keras.optimizers.schedules.LearningRateSchedule):
         self.warmup_steps = (
             tf.cast(warmup_steps, tf.float32) if warmup_steps is not None else None
         )
+        # Precompute the constant factors of the schedule.
+        self._pi_over_max_step = tf.constant(np.pi, dtype=tf.float32) / self.max_step
+        self._half_range = 0.5 * (self.eta_max - self.eta_min)
 
     def __call__(self, step):
         step = tf.cast(step, tf.float32)
-        annealing = lambda: (
-            self.eta_min
-            + 0.5
-            * (self.eta_max - self.eta_min)
-            * (1 + tf.cos(np.pi * step / self.max_step))
+        annealing = self.eta_min + self._half_range * (
+            1 + tf.cos(step * self._pi_over_max_step)
         )
-        linear = lambda: self.eta_max * step / tf.cast(self.warmup_steps, tf.float32)
         if self.warmup_steps is None:
-            return annealing()
-        return tf.cond(
-            tf.less(step, self.warmup_steps), true_fn=linear, false_fn=annealing
+            return annealing
+        linear = self.eta_max * step / self.warmup_steps
+        return tf.where(step < self.warmup_steps, linear, annealing)
+
+    def as_numpy(self, steps):
+        """Evaluates the schedule with NumPy, e.g. for offline analysis.
+
+        Args:
+          steps: A NumPy array of steps.
+
+        Returns:
+          A NumPy array with the learning rate of each step.
+        """
+        steps = np.asarray(steps, dtype=np.float32)
+        eta_max = float(self.eta_max)
+        eta_min = float(self.eta_min)
+        annealing = eta_min + 0.5 * (eta_max - eta_min) * (
+            1 + np.cos(np.pi * steps / float(self.max_step))
         )
+        if self.warmup_steps is None:
+            return annealing
+        warmup_steps = float(self.warmup_steps)
+        linear = eta_max * steps / warmup_steps
+        return np.where(steps < warmup_steps, linear, annealing)
+
+    def sum_squares(self, start=0, end=None):
+        r"""Returns the sum of the squared learning rates over a range of steps.
+
+        The sum is computed in closed form and does not evaluate each step. For
+        example without warmup and :obj:`eta_min`, the sum over the full schedule
+        is :math:`\frac{3}{8} \eta_{max}^2 N + \frac{1}{2} \eta_{max}^2`.
+
+        Args:
+          start: The first step.
+          end: The step after the last one. Defaults to :obj:`max_step` + 1.
+
+        Returns:
+          The sum as a Python float.
+        """
+        eta_max = float(self.eta_max)
+        eta_min = float(self.eta_min)
+        max_step = float(self.max_step)
+        if end is None:
+            end = int(max_step) + 1
+        total = 0.0
+
+        if self.warmup_steps is not None:
+            warmup_steps = float(self.warmup_steps)
+            warmup_end = min(end, int(np.ceil(warmup_steps)))
+            if start < warmup_end:
+                total += (eta_max / warmup_steps) ** 2 * (
+                    _sum_of_squares(warmup_end - 1) - _sum_of_squares(start - 1)
+                )
+                start = warmup_end
+
+        if start < end:
+            # lr = c + h * cos(theta * step), so lr^2 expands into sums of cosines.
+            theta = np.pi / max_step
+            h = 0.5 * (eta_max - eta_min)
+            c = eta_min + h
+            num_steps = end - start
+            total += (
+                num_steps * c**2
+                + 2 * c * h * _sum_of_cosines(theta, start, end - 1)
+                + h**2 * (num_steps + _sum_of_cosines(2 * theta, start, end - 1)) / 2
+            )
+
+        return float(total)
+
+
+@register_learning_rate_schedule
+class CosineRsqrtDecay(tf.keras.optimizers.schedules.LearningRateSchedule):
+    r"""Cosine decay during the first quarter of the training, followed by a
+    decay based on the reciprocal of the step square root.
+
+    For :math:`\text{step} \leq N / 4`:
+
+    .. math::
+
+        \text{schedule}(\text{step}) = \text{min_lr}
+                                       + \frac{1}{2}
+                                       (\text{max_lr} - \text{min_lr})
+                                       \left(1 + \cos\left(
+                                       \frac{2 \pi \text{step}}{N}\right)\right)
+
+    After:
+
+    .. math::
+
+        \text{schedule}(\text{step}) = \frac{\alpha}{\sqrt{\text{step} + \beta}}
+
+    where :math:`N` is :obj:`total_steps`, and :math:`\alpha` and :math:`\beta`
+    are set so that the schedule and its derivative are continuous at
+    :math:`N / 4`.
+    """
+
+    def __init__(self, max_lr, min_lr, total_steps):
+        """Initializes the decay function.
+
+        Args:
+          max_lr: Maximum learning rate.
+          min_lr: Minimum learning rate of the cosine decay.
+          total_steps: The number of training steps :math:`N`.
+
+        Raises:
+          ValueError: if :obj:`max_lr` is not greater than :obj:`min_lr`.
+        """
+        if max_lr <= min_lr:
+            raise ValueError(
+                "max_lr should be greater than min_lr, but got max_lr=%s and "
+                "min_lr=%s" % (max_lr, min_lr)
+            )
+        self.max_lr = tf.cast(max_lr, tf.float32)
+        self.min_lr = tf.cast(min_lr, tf.float32)
+        self.total_steps = tf.cast(total_steps, tf.float32)
+        # Precompute the constant factors of the schedule.
+        self._half_range = 0.5 * (self.max_lr - self.min_lr)
+        self._two_pi_over_total_steps = (
+            tf.constant(2 * np.pi, dtype=tf.float32) / self.total_steps
+        )
+        self._quarter = self.total_steps / 4
+        # At N/4 the cosine decay is equal to (max_lr + min_lr) / 2 and its slope
+        # is -pi * (max_lr - min_lr) / N. Matching the value and the slope of
+        # alpha / sqrt(step + beta) gives:
+        value = self.min_lr + self._half_range
+        self._beta = (
+            self.total_steps * value / (2 * np.pi * (self.max_lr - self.min_lr))
+            - self._quarter
+        )
+        self._alpha = value * tf.math.sqrt(self._quarter + self._beta)
+
+    def __call__(self, step):
+        step = tf.cast(step, tf.float32)
+        # Both phases are computed and selected without control flow. The step is
+        # clipped so that the rsqrt decay stays finite during the cosine decay.
+        cosine = self.min_lr + self._half_range * (
+            1 + tf.cos(step * self._two_pi_over_total_steps)
+        )
+        rsqrt = self._alpha * tf.math.rsqrt(
+            tf.maximum(step, self._quarter) + self._beta
+        )
+        return tf.where(step <= self._quarter, cosine, rsqrt)
+
+    def as_numpy(self, steps):
+        """Evaluates the schedule with NumPy, e.g. for offline analysis.
+
+        Args:
+          steps: A NumPy array of steps.
+
+        Returns:
+          A NumPy array with the learning rate of each step.
+        """
+        steps = np.asarray(steps, dtype=np.float32)
+        min_lr = float(self.min_lr)
+        quarter = float(self._quarter)
+        cosine = min_lr + float(self._half_range) * (
+            1 + np.cos(2 * np.pi * steps / float(self.total_steps))
+        )
+        rsqrt = float(self._alpha) / np.sqrt(
+            np.maximum(steps, quarter) + float(self._beta)
+        )
+        return np.where(steps <= quarter, cosine, rsqrt)
+
+
+def _sum_of_squares(n):
+    """Returns the sum of the squares of the integers from 0 to :obj:`n`."""
+    return n * (n + 1) * (2 * n + 1) / 6
+
+
+def _sum_of_cosines(theta, first, last):
+    """Returns the sum of ``cos(theta * i)`` for the integers from :obj:`first` to
+    :obj:`last`.
+    """
+    half_sine = np.sin(theta / 2)
+    if np.isclose(half_sine, 0):
+        return (last - first + 1) * np.cos(theta * first)
+    return (np.sin((last + 0.5) * theta) - np.sin((first - 0.5) * theta)) / (
+        2 * half_sine
+    )
 
@@ -62,7 +62,7 @@ class Runner(object):
           config: The run configuration.
           auto_config: If ``True``, use automatic configuration values defined by
             :obj:`model`. If not set, the parameter is read from the run configuration.
-          mixed_precision: Enable mixed precision.
+          mixed_precision: Enable mixed precision for training and inference.
           seed: The random seed to set.
 
         Raises:
@@ -374,6 +374,10 @@ class Runner(object):
             the end of the inference loop.
         """
         config = self._finalize_config()
+        # The layers read the global precision policy when they are created, so
+        # it should be set before building the model. The decoding logits are cast
+        # back to float32 before computing the probabilities.
+        mixed_precision = self._mixed_precision and misc.enable_mixed_precision()
         model = self._init_model(config)
         checkpoint = checkpoint_util.Checkpoint.from_config(config, model)
         checkpoint.restore(checkpoint_path=checkpoint_path, weights_only=True)
@@ -393,6 +397,9 @@ class Runner(object):
             log_time=log_time,
         )
 
+        if mixed_precision:
+            misc.disable_mixed_precision()
+
     def export(self, export_dir, checkpoint_path=None, exporter=None):
         """Exports a model.
 
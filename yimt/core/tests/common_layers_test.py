@@ -20,6 +20,21 @@ class CommonLayersTest(tf.test.TestCase):
         self.assertEqual(layer.kernel.ref(), weight.ref())
         self.assertEqual(self.evaluate(tf.reduce_sum(y)), 0)
 
+    def testAdaptiveSoftmax(self):
+        layer = common.AdaptiveSoftmax(20, [5, 12])
+        x = tf.random.uniform([4, 3, 16])
+        y = layer(x)
+        self.assertListEqual(y.shape.as_list(), [4, 3, 20])
+        self.assertAllClose(tf.reduce_sum(tf.exp(y), axis=-1), tf.ones([4, 3]))
+        self.assertListEqual(
+            [projection.units for projection in layer.tail_projections], [4, 1]
+        )
+
+    @parameterized.expand([[[]], [[5, 5]], [[0, 5]], [[5, 20]]])
+    def testAdaptiveSoftmaxInvalidCutoffs(self, cutoffs):
+        with self.assertRaises(ValueError):
+            common.AdaptiveSoftmax(20, cutoffs)
+
     def testLayerNorm(self):
         layer_norm = common.LayerNorm()
         x = tf.random.uniform([4, 10])
@@ -1,3 +1,4 @@
+import numpy as np
 import tensorflow as tf
 from parameterized import parameterized
 
@@ -9,6 +10,18 @@ class _IdentitySchedule(tf.keras.optimizers.schedules.LearningRateSchedule):
         return step
 
 
+class _ConstantSchedule(tf.keras.optimizers.schedules.LearningRateSchedule):
+    def __call__(self, step):
+        return 0.5
+
+
+class _PyFunctionSchedule(tf.keras.optimizers.schedules.LearningRateSchedule):
+    def __call__(self, step):
+        return tf.py_function(
+            lambda x: tf.cast(1 / (x + 1), tf.float32), [step], tf.float32
+        )
+
+
 class LRSchedulesTest(tf.test.TestCase):
     def _testSchedule(self, schedule, expected_values):
         for i, expected_value in enumerate(expected_values):
@@ -20,6 +33,55 @@ class LRSchedulesTest(tf.test.TestCase):
         step = tf.constant(1, dtype=tf.int64)
         schedule(step)
 
+    @parameterized.expand(
+        [
+            (lr_schedules.NoamDecay(2.0, 512, 4000),),
+            (lr_schedules.RsqrtDecay(2.0, 4000),),
+            (lr_schedules.InvSqrtDecay(0.0002, 4000, initial_learning_rate=1e-07),),
+            (lr_schedules.CosineAnnealing(2.5e-4, max_step=100000),),
+            (lr_schedules.CosineAnnealing(2.5e-4, max_step=100000, warmup_steps=4000),),
+            (lr_schedules.CosineRsqrtDecay(1e-3, 1e-4, 100000),),
+        ]
+    )
+    def testScheduleAsNumpy(self, schedule):
+        steps = np.array([0, 1, 3999, 4000, 4001, 50000, 100000])
+        expected = [schedule(step) for step in steps]
+        self.assertAllClose(schedule.as_numpy(steps), expected)
+
+    @parameterized.expand(
+        [
+            (None, 0, 0, None),
+            (None, 0.1, 0, None),
+            (10, 0, 0, None),
+            (10, 0.1, 5, 80),
+            (10.5, 0, 0, 250),
+        ]
+    )
+    def testCosineAnnealingSumSquares(self, warmup_steps, eta_min, start, end):
+        schedule = lr_schedules.CosineAnnealing(
+            2.0, eta_min=eta_min, max_step=100, warmup_steps=warmup_steps
+        )
+        steps = np.arange(start, end if end is not None else 101)
+        expected = np.sum(schedule.as_numpy(steps).astype(np.float64) ** 2)
+        self.assertAllClose(schedule.sum_squares(start, end), expected, rtol=1e-4)
+        if warmup_steps is None and eta_min == 0:
+            self.assertAllClose(schedule.sum_squares(), 3 / 8 * 4 * 100 + 0.5 * 4)
+
+    @parameterized.expand(
+        [
+            (lr_schedules.NoamDecay(2.0, 512, 4000),),
+            (lr_schedules.InvSqrtDecay(0.0002, 4000),),
+            (lr_schedules.CosineAnnealing(2.5e-4, max_step=100000, warmup_steps=4000),),
+            (lr_schedules.CosineRsqrtDecay(1e-3, 1e-4, 100000),),
+        ]
+    )
+    def testScheduleWithoutControlFlow(self, schedule):
+        function = tf.function(schedule).get_concrete_function(
+            tf.TensorSpec([], dtype=tf.int64)
+        )
+        op_types = set(op.type for op in function.graph.get_operations())
+        self.assertFalse(op_types & {"If", "StatelessIf", "Switch", "Merge"})
+
     def testGetScheduleClass(self):
         with self.assertRaises(ValueError):
             lr_schedules.get_lr_schedule_class("ScheduleWrapper")
@@ -38,6 +100,7 @@ class LRSchedulesTest(tf.test.TestCase):
         )
         self.assertIsInstance(wrapper.schedule, lr_schedules.NoamDecay)
         self.assertEqual(wrapper.schedule.scale, 2)
+        self.assertEqual(wrapper._call.experimental_get_tracing_count(), 1)
 
         wrapper = lr_schedules.make_learning_rate_schedule(
             None, "NoamDecay", dict(scale=2, model_dim=512, warmup_steps=4000)
@@ -47,6 +110,38 @@ class LRSchedulesTest(tf.test.TestCase):
         with self.assertRaises(ValueError):
             lr_schedules.make_learning_rate_schedule(2.0, "InvalidScheduleName")
 
+    def testMakeScheduleDoesNotModifyParams(self):
+        schedule_params = dict(model_dim=512, warmup_steps=4000)
+        wrapper = lr_schedules.make_learning_rate_schedule(
+            2.0, "NoamDecay", schedule_params
+        )
+        self.assertTrue(wrapper.one_indexed)
+        self.assertDictEqual(schedule_params, dict(model_dim=512, warmup_steps=4000))
+
+    def testMakeScheduleMaterialize(self):
+        wrapper = lr_schedules.make_learning_rate_schedule(
+            2.0,
+            "NoamDecay",
+            dict(model_dim=512, warmup_steps=10),
+            materialize_steps=20,
+        )
+        self.assertEqual(wrapper._table.shape[0], 20)
+        schedule = lr_schedules.ScheduleWrapper(lr_schedules.NoamDecay(2.0, 512, 10))
+        self.assertAllClose(
+            [wrapper(step) for step in range(30)],
+            [schedule(step) for step in range(30)],
+        )
+
+    def testMakeScheduleCachesSignature(self):
+        lr_schedules.make_learning_rate_schedule(
+            2.0, "NoamDecay", dict(model_dim=512, warmup_steps=4000)
+        )
+        hits = lr_schedules._get_arguments.cache_info().hits
+        lr_schedules.make_learning_rate_schedule(
+            2.0, "NoamDecay", dict(model_dim=512, warmup_steps=4000)
+        )
+        self.assertEqual(lr_schedules._get_arguments.cache_info().hits, hits + 1)
+
     def testScheduleWrapper(self):
         self._testSchedule(
             lr_schedules.ScheduleWrapper(_IdentitySchedule()), [0, 1, 2, 3, 4]
@@ -64,8 +159,120 @@ class LRSchedulesTest(tf.test.TestCase):
             [2, 2, 2, 3, 4, 5],
         )
 
+    def testScheduleWrapperFloatParameters(self):
+        schedule = lr_schedules.ScheduleWrapper(
+            _IdentitySchedule(), step_start=2.0, step_duration=2.0
+        )
+        self.assertEqual(schedule(7), 2)
+
+    def testScheduleWrapperReturnsTensor(self):
+        schedule = lr_schedules.ScheduleWrapper(_ConstantSchedule())
+        value = schedule(0)
+        self.assertIsInstance(value, tf.Tensor)
+        self.assertEqual(value, 0.5)
+        schedule = lr_schedules.ScheduleWrapper(
+            _ConstantSchedule(), minimum_learning_rate=1
+        )
+        self.assertEqual(schedule(0), 1)
+
+    @parameterized.expand([(0, 1), (0.5, 2)])
+    def testScheduleWrapperMinimumOp(self, minimum_learning_rate, num_maximum_ops):
+        schedule = lr_schedules.ScheduleWrapper(
+            _IdentitySchedule(), minimum_learning_rate=minimum_learning_rate
+        )
+        graph = schedule._call.get_concrete_function().graph
+        op_types = [op.type for op in graph.get_operations()]
+        # The step mapping always uses one maximum.
+        self.assertEqual(op_types.count("Maximum"), num_maximum_ops)
+
+    def testScheduleWrapperJitCompile(self):
+        schedule = lr_schedules.ScheduleWrapper(lr_schedules.NoamDecay(2.0, 512, 10))
+        self.assertTrue(schedule.jit_compile)
+        schedule = lr_schedules.ScheduleWrapper(
+            tf.keras.optimizers.schedules.PiecewiseConstantDecay([10], [1.0, 0.5])
+        )
+        self.assertFalse(schedule.jit_compile)
+        self.assertEqual(schedule(20), 0.5)
+
+        # This schedule can not be compiled with XLA.
+        schedule = lr_schedules.ScheduleWrapper(_PyFunctionSchedule())
+        self.assertFalse(schedule.jit_compile)
+        optimizer = tf.keras.optimizers.SGD(learning_rate=schedule)
+        variable = tf.Variable(1.0)
+        optimizer.apply_gradients([(tf.constant(1.0), variable)])
+        self.assertAllClose(variable, 0.0)
+
+    def testScheduleWrapperTracedOnce(self):
+        schedule = lr_schedules.ScheduleWrapper(
+            lr_schedules.NoamDecay(2.0, 512, 4000), step_duration=2
+        )
+        values = [
+            schedule(10),
+            schedule(tf.constant(10, dtype=tf.int32)),
+            schedule(tf.constant(10.0, dtype=tf.float32)),
+            schedule(tf.constant(10, dtype=tf.int64)),
+        ]
+        self.assertAllEqual(values, [values[0]] * len(values))
+        self.assertEqual(schedule._call.experimental_get_tracing_count(), 1)
+
+        optimizer = tf.keras.optimizers.SGD(learning_rate=schedule)
+        variable = tf.Variable(1.0)
+        optimizer.apply_gradients([(tf.constant(1.0), variable)])
+        self.assertAllClose(variable, 1.0 - schedule(0))
+
+    def testScheduleWrapperEvaluateRange(self):
+        schedule = lr_schedules.ScheduleWrapper(
+            lr_schedules.CosineAnnealing(1.0, max_step=100, warmup_steps=10),
+            step_duration=2,
+        )
+        values = schedule.evaluate_range(5, 50)
+        self.assertAllClose(values, [schedule(step) for step in range(5, 50)])
+
+    def testScheduleWrapperMaterialize(self):
+        def _make_schedule():
+            return lr_schedules.ScheduleWrapper(
+                lr_schedules.NoamDecay(2.0, 512, 10),
+                step_start=2,
+                step_duration=3,
+                minimum_learning_rate=0.01,
+            )
+
+        schedule = _make_schedule()
+        expected = [schedule(step) for step in range(40)]
+        schedule = _make_schedule()
+        schedule.materialize(30)
+        self.assertEqual(schedule._table.shape[0], 30)
+        self.assertAllClose([schedule(step) for step in range(40)], expected)
+
+    @parameterized.expand(
+        [
+            ("NoamDecay", dict(model_dim=512, warmup_steps=10)),
+            ("InvSqrtDecay", dict(warmup_steps=10)),
+        ]
+    )
+    def testScheduleWrapperOneIndexed(self, schedule_type, schedule_params):
+        wrapper = lr_schedules.make_learning_rate_schedule(
+            2.0, schedule_type, dict(schedule_params), schedule_step_duration=2
+        )
+        self.assertTrue(wrapper.one_indexed)
+        self.assertTrue(wrapper.schedule.one_indexed)
+        schedule_class = lr_schedules.get_lr_schedule_class(schedule_type)
+        schedule = lr_schedules.ScheduleWrapper(
+            schedule_class(2.0, **schedule_params), step_duration=2
+        )
+        self.assertFalse(schedule.one_indexed)
+        self.assertAllClose(
+            wrapper.evaluate_range(0, 50), schedule.evaluate_range(0, 50)
+        )
+
     def testNoamDecay(self):
-        self._testNoError(lr_schedules.NoamDecay(2.0, 512, 4000))
+        schedule = lr_schedules.NoamDecay(2.0, 512, 4000)
+        self._testNoError(schedule)
+        for step in (0, 3999, 4000, 100000):
+            expected = (
+                2.0 * 512**-0.5 * min((step + 1) ** -0.5, (step + 1) * 4000**-1.5)
+            )
+            self.assertAllClose(schedule(step), expected)
 
     def testRsqrtDecay(self):
         self._testNoError(lr_schedules.RsqrtDecay(2.0, 4000))
@@ -79,11 +286,33 @@ class LRSchedulesTest(tf.test.TestCase):
         )
         self.assertNotEqual(schedule(0), initial_learning_rate)
         self.assertEqual(schedule(warmup_steps - 1), learning_rate)
+        self.assertAllClose(schedule(warmup_steps * 4 - 1), learning_rate / 2)
 
     def testCosineAnnealing(self):
         self._testNoError(
             lr_schedules.CosineAnnealing(2.5e-4, max_step=1000000, warmup_steps=4000)
         )
+        schedule = lr_schedules.CosineAnnealing(
+            1.0, eta_min=0.2, max_step=100, warmup_steps=10
+        )
+        self.assertAllClose(schedule(5), 0.5)
+        self.assertAllClose(schedule(10), 0.2 + 0.4 * (1 + np.cos(np.pi * 0.1)))
+        self.assertAllClose(schedule(50), 0.6)
+        self.assertAllClose(schedule(100), 0.2)
+        schedule = lr_schedules.CosineAnnealing(1.0, max_step=100)
+        self.assertAllClose(schedule(0), 1.0)
+
+    def testCosineRsqrtDecay(self):
+        self._testNoError(lr_schedules.CosineRsqrtDecay(1e-3, 1e-4, 100000))
+        schedule = lr_schedules.CosineRsqrtDecay(1.0, 0.2, 400)
+        self.assertAllClose(schedule(0), 1.0)
+        self.assertAllClose(schedule(50), 0.6 + 0.4 * np.cos(np.pi / 4))
+        self.assertAllClose(schedule(100), 0.6)
+        # The schedule and its slope are continuous after the cosine decay.
+        self.assertAllClose(schedule(101), 0.6 - 0.8 * np.pi / 400, atol=1e-4)
+        self.assertAllGreater(schedule(100000), 0)
+        with self.assertRaises(ValueError):
+            lr_schedules.CosineRsqrtDecay(0.2, 1.0, 400)
 
 
 if __name__ == "__main__":
@@ -1,13 +1,16 @@
 import os
 
+from unittest import mock
+
+import numpy as np
 import tensorflow as tf
 
 from parameterized import parameterized
 
-from yimt.core import encoders, models
-from yimt.core import inputters, decoders
+from yimt.core import data, encoders, models
+from yimt.core import inputters, decoders, layers
 from yimt.core.tests import test_util
-from yimt.core.utils import misc
+from yimt.core.utils import decoding, misc
 
 
 def _seq2seq_model(training=None, shared_embeddings=False):
@@ -296,9 +299,163 @@ class ModelTest(tf.test.TestCase):
         features_file, labels_file, data_config = self._makeToyEnDeData()
         data_config["source_sequence_controls"] = {"start": True, "end": True}
         model.initialize(data_config, params=params)
+        model.create_variables()
+        # Force the decoder to only generate the unknown token.
+        bias = model.decoder.output_layer.bias
+        bias.assign(tf.one_hot(bias.shape[0] - 1, bias.shape[0], on_value=100.0))
+        dataset = model.examples_inputter.make_inference_dataset(features_file, 16)
+        features = next(iter(dataset))
+        _, predictions = model(features)
+        self.assertNotIn(b"<unk>", predictions["tokens"].numpy().flatten().tolist())
+
+    def testSequenceToSequenceWithReplaceUnknownTargetInVocabulary(self):
+        model, params = _seq2seq_model()
+        params["replace_unknown_target"] = True
+        features_file, _, data_config = self._makeToyEnDeData()
+        with open(data_config["target_vocabulary"], "a", encoding="utf-8") as vocab:
+            vocab.write("<unk>\n")
+        model.initialize(data_config, params=params)
+        model.create_variables()
+        # Force the decoder to only generate the unknown token of the vocabulary.
+        unknown_id = model.labels_inputter.vocabulary_size - 2
+        self.assertEqual(model._unknown_id, unknown_id)
+        bias = model.decoder.output_layer.bias
+        bias.assign(tf.one_hot(unknown_id, bias.shape[0], on_value=100.0))
+        dataset = model.examples_inputter.make_inference_dataset(features_file, 16)
+        _, predictions = model(next(iter(dataset)))
+        self.assertNotIn(b"<unk>", predictions["tokens"].numpy().flatten().tolist())
+
+    @parameterized.expand(
+        [[tf.estimator.ModeKeys.TRAIN], [tf.estimator.ModeKeys.PREDICT]]
+    )
+    def testSequenceToSequenceWithAdaptiveSoftmax(self, mode):
+        model, params = _seq2seq_model(mode)
+        params["adaptive_softmax_cutoffs"] = [10, 20]
+        features_file, labels_file, data_config = self._makeToyEnDeData()
+        self._testGenericModel(
+            model,
+            mode,
+            features_file,
+            labels_file,
+            data_config,
+            params=params,
+        )
+        self.assertIsInstance(model.decoder.output_layer, layers.AdaptiveSoftmax)
+
+    def testSequenceToSequenceWithJitCompiledEncoder(self):
+        model, params = _seq2seq_model()
+        params["beam_width"] = 2
+        features_file, labels_file, data_config = self._makeToyEnDeData()
+        model.initialize(data_config, params=params)
+        dataset = model.examples_inputter.make_inference_dataset(features_file, 16)
+        features = next(iter(dataset))
+        _, predictions = model(features)
+
+        jit_model, jit_params = _seq2seq_model()
+        jit_params["beam_width"] = 2
+        jit_params["jit_compile_encoder"] = True
+        jit_model.initialize(data_config, params=jit_params)
+        dataset = jit_model.examples_inputter.make_evaluation_dataset(
+            features_file, labels_file, 16
+        )
+        eval_features, labels = next(iter(dataset))
+        jit_model(eval_features, labels=labels)
+        self.assertIsNone(jit_model._jit_compiled_encoder)
+        jit_model.set_weights(model.get_weights())
+        _, jit_predictions = jit_model(features)
+        self.assertIsNotNone(jit_model._jit_compiled_encoder)
+        self.assertAllEqual(jit_predictions["tokens"], predictions["tokens"])
+
+    def testSequenceToSequenceBeamSearchWithoutMemoryTiling(self):
+        model, params = _seq2seq_model()
+        params["beam_width"] = 4
+        params["num_hypotheses"] = 0
+        features_file, _, data_config = self._makeToyEnDeData()
+        model.initialize(data_config, params=params)
+        self.assertTrue(model.decoder.support_memory_broadcast)
+        dataset = model.examples_inputter.make_inference_dataset(features_file, 16)
+        features = next(iter(dataset))
+        _, predictions = model(features)
+        with mock.patch.object(
+            decoders.SelfAttentionDecoder,
+            "support_memory_broadcast",
+            new_callable=mock.PropertyMock,
+            return_value=False,
+        ):
+            _, tiled_predictions = model(features)
+        self.assertAllEqual(predictions["tokens"], tiled_predictions["tokens"])
+        self.assertAllClose(predictions["log_probs"], tiled_predictions["log_probs"])
+
+    @test_util.run_with_mixed_precision
+    def testSequenceToSequenceInferenceMixedPrecision(self):
+        model, params = _seq2seq_model()
+        params["beam_width"] = 2
+        params["replace_unknown_target"] = True
+        features_file, _, data_config = self._makeToyEnDeData()
+        model.initialize(data_config, params=params)
         dataset = model.examples_inputter.make_inference_dataset(features_file, 16)
         features = next(iter(dataset))
         _, predictions = model(features)
+        self.assertEqual(predictions["log_probs"].dtype, tf.float32)
+        self.assertEqual(predictions["alignment"].dtype, tf.float32)
+
+    def testSequenceToSequenceDecodingParams(self):
+        model, params = _seq2seq_model()
+        params["beam_width"] = 3
+        params["length_penalty"] = 0.2
+        params["sampling_topk"] = 5
+        _, _, data_config = self._makeToyEnDeData()
+        model.initialize(data_config, params=params)
+        self.assertIsInstance(model._decoding_strategy, decoding.BeamSearch)
+        self.assertEqual(model._decoding_strategy.beam_size, 3)
+        self.assertEqual(model._decoding_strategy.length_penalty, 0.2)
+        self.assertIsInstance(model._sampler, decoding.RandomSampler)
+
+    @parameterized.expand([[True], [False]])
+    def testSequenceToSequenceIdsToTokens(self, export_vocabulary_assets):
+        model, params = _seq2seq_model()
+        features_file, _, data_config = self._makeToyEnDeData()
+        data_config["export_vocabulary_assets"] = export_vocabulary_assets
+        model.initialize(data_config, params=params)
+        if export_vocabulary_assets:
+            self.assertIsNone(model._ids_to_tokens)
+        else:
+            self.assertIsInstance(model._ids_to_tokens, data.GatherLookupTable)
+        dataset = model.examples_inputter.make_inference_dataset(features_file, 16)
+        _, predictions = model(next(iter(dataset)))
+        self.assertEqual(predictions["tokens"].dtype, tf.string)
+
+    def testSequenceToSequenceNumHypotheses(self):
+        model, params = _seq2seq_model()
+        params["beam_width"] = 4
+        params["num_hypotheses"] = 2
+        params["replace_unknown_target"] = True
+        features_file, _, data_config = self._makeToyEnDeData()
+        model.initialize(data_config, params=params)
+        dataset = model.examples_inputter.make_inference_dataset(features_file, 16)
+        features = next(iter(dataset))
+        _, predictions = model(features)
+        for key in ("tokens", "length", "log_probs", "alignment"):
+            self.assertEqual(predictions[key].shape[1], 2)
+
+    def testSequenceToSequenceFormatPrediction(self):
+        model, params = _seq2seq_model()
+        _, _, data_config = self._makeToyEnDeData()
+        model.initialize(data_config, params=params)
+        prediction = {
+            "tokens": np.array([[b"a", b"b", b"c"], [b"d", b"", b""]]),
+            "length": np.array([3, 1]),
+            "log_probs": np.array([-1.0, -2.0]),
+            "alignment": np.array([np.eye(3), np.eye(3)]),
+        }
+        outputs = model.format_prediction(
+            prediction, params={"n_best": 2, "with_scores": True}
+        )
+        self.assertListEqual(outputs, ["-1.000000 ||| a b c", "-2.000000 ||| d"])
+        outputs = model.format_prediction(
+            prediction, params={"with_alignments": "hard"}
+        )
+        self.assertListEqual(outputs, ["a b c ||| 0-0 1-1 2-2", "d ||| 0-0"])
 
     def testSequenceToSequenceWithNoisyDecoding(self):
         model, params = _seq2seq_model()
@@ -315,6 +472,13 @@ class ModelTest(tf.test.TestCase):
         features = next(iter(dataset))
         _, predictions = model(features)
 
+    def testSequenceToSequenceWithInvalidDecodingNoise(self):
+        model, params = _seq2seq_model()
+        params["decoding_noise"] = [{"swap": 0.1}]
+        _, _, data_config = self._makeToyEnDeData()
+        with self.assertRaisesRegex(ValueError, "Invalid noise type"):
+            model.initialize(data_config, params=params)
+
     def testSequenceToSequenceWithContrastiveLearning(self):
         model, params = _seq2seq_model()
         params["contrastive_learning"] = True
@@ -332,6 +496,18 @@ class ModelTest(tf.test.TestCase):
         loss = model.compute_loss(outputs, labels, training=True)
         self.assertGreaterEqual(self.evaluate(loss), 0)
 
+        # The true and noisy targets are decoded in the same batch, which should
+        # not change the true target logits.
+        outputs, _ = model(features, labels=labels, training=False)
+        clean_labels = {
+            key: value for key, value in labels.items() if not key.startswith("noisy")
+        }
+        clean_outputs, _ = model(features, labels=clean_labels, training=False)
+        self.assertAllClose(outputs["logits"], clean_outputs["logits"], atol=1e-5)
+        self.assertEqual(
+            outputs["noisy_logits"].shape[1], tf.shape(labels["noisy_ids"])[1]
+        )
+
     def testSequenceToSequenceServing(self):
         # Test that serving features can be forwarded into the model.
         _, _, data_config = self._makeToyEnDeData()
@@ -344,6 +520,16 @@ class ModelTest(tf.test.TestCase):
         op_types = set(op.type for op in concrete_function.graph.get_operations())
         self.assertNotIn("Addons>GatherTree", op_types)
 
+    def testSequenceToSequenceServingStaticBeamDimension(self):
+        _, _, data_config = self._makeToyEnDeData()
+        model, params = _seq2seq_model()
+        params["beam_width"] = 4
+        params["num_hypotheses"] = 0
+        model.initialize(data_config, params=params)
+        outputs = model.serve_function().get_concrete_function().structured_outputs
+        self.assertListEqual(outputs["tokens"].shape.as_list(), [None, 4, None])
+        self.assertListEqual(outputs["log_probs"].shape.as_list(), [None, 4])
+
     def testCreateVariables(self):
         _, _, data_config = self._makeToyEnDeData()
         model, params = _seq2seq_model()
@@ -90,6 +90,23 @@ class SequenceToSequenceTest(tf.test.TestCase):
             ],
         )
 
+    def testMaskAttentionEndOnly(self):
+        attention = [[[0.5, 0.3, 0.2], [0.1, 0.1, 0.8]]]
+        self.assertAllClose(
+            sequence_to_sequence.mask_attention(attention, [2], False, True),
+            [[[0.5, 0.3, 0.0], [0.1, 0.1, 0.0]]],
+        )
+
+    def testTileBatch(self):
+        outputs = tf.reshape(tf.range(12), [3, 2, 2])
+        length = tf.constant([2, 1, 2])
+        tiled_outputs, tiled_state, tiled_length = sequence_to_sequence._tile_batch(
+            (outputs, None, length), 2
+        )
+        self.assertIsNone(tiled_state)
+        self.assertAllEqual(tiled_length, [2, 2, 1, 1, 2, 2])
+        self.assertAllEqual(tiled_outputs, tf.gather(outputs, [0, 0, 1, 1, 2, 2]))
+
     def testSequenceToSequenceInputter(self):
         source_vocabulary = test_util.make_data_file(
             os.path.join(self.get_temp_dir(), "src_vocab.txt"),
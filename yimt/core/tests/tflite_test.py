@@ -94,6 +94,21 @@ class TFLiteTest(tf.test.TestCase):
         pred, tflite_pred = _get_predictions(created_model, dataset, vocab_path)
         self.assertAllEqual(pred, tflite_pred)
 
+    def testTFLiteFixedInputSize(self):
+        vocab, _ = _create_vocab(self.get_temp_dir())
+        model = _make_model(catalog.TransformerBase, vocab, {"tflite_input_size": 8})
+        tflite_fn = model.tflite_function()
+        concrete_fn = tflite_fn.get_concrete_function()
+        self.assertListEqual(concrete_fn.inputs[0].shape.as_list(), [8])
+        ids = tf.constant([4, 4, 5, 3], dtype=tf.int32)
+        padded_ids = tf.pad(ids, [[0, 4]])
+        with model.enable_tflite_mode():
+            dynamic_fn = tf.function(
+                lambda ids: model({"ids": ids[None], "length": tf.size(ids)[None]})[1]
+            )
+            expected = dynamic_fn(ids)
+        self.assertAllEqual(concrete_fn(padded_ids), expected)
+
     @parameterized.expand(
         [
             [catalog.TransformerBase, {"beam_width": 3}],
@@ -118,6 +118,11 @@ class TokenizerTest(tf.test.TestCase):
             ["Hello world !", "Test", "", "My name"],
         )
 
+    def testDetokenizeBatchOfBytes(self):
+        tokenizer = tokenizers.SpaceTokenizer()
+        text = tokenizer.detokenize([[b"Hello", b"world"], [], ["Good", b"!"]])
+        self.assertListEqual(text, ["Hello world", "", "Good !"])
+
     def testCharacterTokenizer(self):
         self._testTokenizer(
             tokenizers.CharacterTokenizer(),
@@ -1,3 +1,5 @@
+from unittest import mock
+
 import numpy as np
 import tensorflow as tf
 
@@ -109,6 +111,21 @@ class TransformerTest(tf.test.TestCase):
         inputs, combined = self.evaluate([inputs, combined])
         self.assertAllEqual(inputs, combined)
 
+    def testSplitAndCombineHeadsSingleTimestep(self):
+        num_heads = 4
+        inputs = tf.random.normal([3, 1, 20])
+        split = transformer.split_heads(inputs, num_heads)
+        expected = tf.transpose(tf.reshape(inputs, [3, 1, num_heads, 5]), [0, 2, 1, 3])
+        self.assertAllEqual(split, expected)
+        self.assertAllEqual(transformer.combine_heads(split), inputs)
+
+    def testMergeAndSplitBeams(self):
+        inputs = tf.random.normal([6, 4, 2, 5])
+        merged = transformer.merge_beams_in_time(inputs, 3)
+        self.assertListEqual(merged.shape.as_list(), [2, 4, 6, 5])
+        self.assertAllEqual(merged[1, :, 2:4], inputs[4])
+        self.assertAllEqual(transformer.split_beams_from_time(merged, 3), inputs)
+
     def testRelativePositions(self):
         positions = transformer.relative_positions(4, 2)
         self.assertAllEqual(
@@ -194,6 +211,59 @@ class TransformerTest(tf.test.TestCase):
         y2, cache = attention(x, memory=memory, mask=mask, cache=cache)
         self.assertAllEqual(y1, y2)
 
+    def testMultiHeadAttentionWithCacheAndBroadcastedMemory(self):
+        beam_size = 3
+        attention = transformer.MultiHeadAttention(4, 20, return_attention=True)
+        memory = tf.random.uniform([2, 3, 10])
+        mask = tf.sequence_mask([1, 3])
+        x = tf.random.uniform([2 * beam_size, 1, 10])
+        cache = (tf.zeros([2, 4, 0, 5]), tf.zeros([2, 4, 0, 5]))
+        y, cache, attn = attention(
+            x, memory=memory, mask=mask, cache=cache, memory_beam_size=beam_size
+        )
+        self.assertEqual(cache[0].shape[0], 2)
+
+        tiled_cache = (tf.zeros([6, 4, 0, 5]), tf.zeros([6, 4, 0, 5]))
+        tiled_y, _, tiled_attn = attention(
+            x,
+            memory=tf.repeat(memory, beam_size, axis=0),
+            mask=tf.repeat(mask, beam_size, axis=0),
+            cache=tiled_cache,
+        )
+        self.assertAllClose(y, tiled_y)
+        self.assertAllClose(attn, tiled_attn)
+
+    def testMultiHeadAttentionWithMemoryWithoutCache(self):
+        attention = transformer.MultiHeadAttention(4, 20, return_attention=True)
+
+        @tf.function
+        def _call(x, memory, mask):
+            return attention(x, memory=memory, mask=mask)
+
+        x = tf.random.uniform([2, 5, 10])
+        memory = tf.random.uniform([2, 3, 10])
+        mask = tf.sequence_mask([1, 3])
+        with mock.patch.object(
+            transformer, "merge_beams_in_time", wraps=transformer.merge_beams_in_time
+        ) as merge_beams:
+            graph = _call.get_concrete_function(x, memory, mask).graph
+            merge_beams.assert_not_called()
+        y, _, attn = graph.structured_outputs
+        self.assertListEqual(y.shape.as_list(), [2, 5, 20])
+        self.assertListEqual(attn.shape.as_list(), [2, 4, 5, 3])
+
+    @parameterized.expand([[None], [1]])
+    def testMultiHeadAttentionWithCacheAndTiledMemory(self, memory_beam_size):
+        attention = transformer.MultiHeadAttention(4, 20)
+        memory = tf.random.uniform([2, 3, 10])
+        x = tf.random.uniform([2, 1, 10])
+        cache = (tf.zeros([2, 4, 0, 5]), tf.zeros([2, 4, 0, 5]))
+        with mock.patch.object(
+            transformer, "merge_beams_in_time", wraps=transformer.merge_beams_in_time
+        ) as merge_beams:
+            attention(x, memory=memory, cache=cache, memory_beam_size=memory_beam_size)
+            merge_beams.assert_not_called()
+
     def testMultiHeadAttentionMask(self):
         attention = transformer.MultiHeadAttention(4, 20, return_attention=True)
         queries = tf.random.uniform([4, 5, 10])
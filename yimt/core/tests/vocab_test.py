@@ -2,6 +2,8 @@ import os
 
 import tensorflow as tf
 
+from parameterized import parameterized
+
 from yimt.core.data import vocab as vocab_lib
 from yimt.core.tests import test_util
 
@@ -22,6 +24,11 @@ class VocabTest(tf.test.TestCase):
         self.assertEqual(3, vocab.size)
         self.assertEqual(1, vocab.lookup("titi"))
         self.assertEqual("titi", vocab.lookup(1))
+        self.assertEqual(1, vocab.get_id("titi"))
+        self.assertEqual(-1, vocab.get_id("tutu", default=-1))
+        self.assertEqual("titi", vocab.get_token(1))
+        self.assertIsNone(vocab.get_token(3))
+        self.assertListEqual(list(vocab), ["toto", "titi", "tata"])
 
         pruned_size = vocab.prune(max_size=2)
 
@@ -33,6 +40,31 @@ class VocabTest(tf.test.TestCase):
         self.assertEqual(1, pruned_frequency.size)
         self.assertEqual(0, pruned_frequency.lookup("toto"))
 
+    def testVocabBytesTokens(self):
+        vocab = vocab_lib.Vocab()
+        vocab.add(b"toto")
+        vocab.add("toto")
+        vocab.add("titi".encode("utf-8"))
+
+        self.assertEqual(2, vocab.size)
+        self.assertEqual(0, vocab.lookup(b"toto"))
+        self.assertEqual(1, vocab.lookup("titi"))
+        self.assertIn(b"titi", vocab)
+        self.assertEqual(vocab.prune(max_size=1).words, ["toto"])
+
+    def testVocabFromText(self):
+        text_file = test_util.make_data_file(
+            os.path.join(self.get_temp_dir(), "text.txt"),
+            ["toto titi", "tata toto", "toto"],
+        )
+        vocab = vocab_lib.Vocab(special_tokens=["foo"])
+        vocab.add("titi")
+        vocab.add_from_text(text_file)
+
+        self.assertEqual(vocab.words, ["foo", "titi", "toto", "tata"])
+        pruned = vocab.prune(min_frequency=2)
+        self.assertEqual(pruned.words, ["foo", "toto", "titi"])
+
     def testVocabWithSpecialTokens(self):
         vocab = vocab_lib.Vocab(special_tokens=["foo", "bar"])
 
@@ -70,6 +102,14 @@ class VocabTest(tf.test.TestCase):
 
         self.assertEqual(vocab1.size, vocab2.size)
         self.assertEqual(vocab1.lookup("titi"), vocab2.lookup("titi"))
+        self.assertEqual(vocab2.prune(max_size=2).words, vocab1.words[:2])
+        vocab2.add("titi")
+        self.assertEqual(vocab2.prune(max_size=1).words, ["titi"])
+
+    def testSaveAndLoadEmptyVocab(self):
+        vocab_file = os.path.join(self.get_temp_dir(), "empty_vocab.txt")
+        vocab_lib.Vocab().serialize(vocab_file)
+        self.assertEqual(vocab_lib.Vocab.from_file(vocab_file).size, 0)
 
     def testLoadSentencePieceVocab(self):
         vocab_path = test_util.make_data_file(
@@ -95,6 +135,16 @@ class VocabTest(tf.test.TestCase):
         self.assertNotIn("</s>", vocab)
         self.assertIn("▁the", vocab)
 
+    def testLoadVocabWithDuplicates(self):
+        vocab_path = test_util.make_data_file(
+            os.path.join(self.get_temp_dir(), "vocab_dup"),
+            ["a", "b", "a", "c", "b"],
+        )
+
+        vocab = vocab_lib.Vocab.from_file(vocab_path)
+        self.assertListEqual(vocab.words, ["a", "b", "c"])
+        self.assertEqual(vocab.lookup("c"), 2)
+
     def testVocabPadding(self):
         vocab = vocab_lib.Vocab()
         vocab.add("toto")
@@ -103,6 +153,10 @@ class VocabTest(tf.test.TestCase):
         self.assertEqual(vocab.size, 3)
         vocab.pad_to_multiple(6, num_oov_buckets=1)
         self.assertEqual(vocab.size, 6 - 1)
+        self.assertEqual(vocab.lookup("averyunlikelytoken1"), 4)
+        vocab.pad_to_multiple(16, num_oov_buckets=1)
+        self.assertEqual(vocab.size, 16 - 1)
+        self.assertEqual(len(set(vocab.words)), vocab.size)
 
     def testVocabNoPadding(self):
         vocab = vocab_lib.Vocab()
@@ -113,6 +167,72 @@ class VocabTest(tf.test.TestCase):
         vocab.pad_to_multiple(4, num_oov_buckets=1)
         self.assertEqual(vocab.size, 3)
 
+    @parameterized.expand([[True], [False]])
+    def testCreateLookupTables(self, as_asset):
+        vocab_file = self._saveVocab("vocab_tables.txt", ["a", "b", "c"])
+        size, tokens_to_ids, ids_to_tokens = vocab_lib.create_lookup_tables(
+            vocab_file, as_asset=as_asset
+        )
+        self.assertEqual(size, 4)
+        ids = tokens_to_ids.lookup(tf.constant(["b", "c", "d"]))
+        self.assertAllEqual(ids, [1, 2, 3])
+        tokens = ids_to_tokens.lookup(tf.constant([0, 3], dtype=tf.int64))
+        self.assertAllEqual(tokens, [b"a", b"<unk>"])
+
+    def testCreateLookupTablesNoFinalNewline(self):
+        vocab_file = os.path.join(self.get_temp_dir(), "vocab_no_newline.txt")
+        with open(vocab_file, "w", encoding="utf-8") as vocab:
+            vocab.write("a\nb\nc")
+        size, tokens_to_ids, _ = vocab_lib.create_lookup_tables(vocab_file)
+        self.assertEqual(size, 4)
+        self.assertEqual(self.evaluate(tokens_to_ids.lookup(tf.constant("c"))), 2)
+
+    def testCreateLookupTablesCache(self):
+        vocab_file = self._saveVocab("vocab_cache.txt", ["a", "b", "c"])
+        size, tokens_to_ids, _ = vocab_lib.create_lookup_tables(vocab_file)
+        self.assertEqual(size, 4)
+        cached = vocab_lib.create_lookup_tables(vocab_file)
+        self.assertIs(cached[1], tokens_to_ids)
+        other = vocab_lib.create_lookup_tables(vocab_file, num_oov_buckets=2)
+        self.assertIsNot(other[1], tokens_to_ids)
+
+        stat = os.stat(vocab_file)
+        self._saveVocab("vocab_cache.txt", ["a", "b", "c", "d"])
+        os.utime(vocab_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        size, new_tokens_to_ids, _ = vocab_lib.create_lookup_tables(vocab_file)
+        self.assertEqual(size, 5)
+        self.assertIsNot(new_tokens_to_ids, tokens_to_ids)
+
+    def testCreateLookupTablesGraphModeReusesWords(self):
+        vocab_file = self._saveVocab("vocab_graph.txt", ["a", "b", "c"])
+        hits = vocab_lib._load_vocabulary_words.cache_info().hits
+        for _ in range(2):
+            with tf.Graph().as_default():
+                size, _, _ = vocab_lib.create_lookup_tables(vocab_file, as_asset=False)
+                self.assertEqual(size, 4)
+        self.assertEqual(vocab_lib._load_vocabulary_words.cache_info().hits, hits + 1)
+
+    def testCreateHashLookupTable(self):
+        size, tokens_to_ids = vocab_lib.create_hash_lookup_table(100)
+        self.assertEqual(size, 100)
+        ids = self.evaluate(tokens_to_ids.lookup(tf.constant(["a", "b", "a"])))
+        self.assertEqual(ids[0], ids[2])
+        self.assertTrue(all(0 <= i < 100 for i in ids))
+        ragged_ids = tokens_to_ids.lookup(tf.ragged.constant([["a"], ["b", "a"]]))
+        self.assertAllEqual(ragged_ids.flat_values, ids[[0, 1, 2]])
+
+    def testCreateIdsToTokensTable(self):
+        vocab_file = self._saveVocab("vocab_gather.txt", ["a", "b", "c"])
+        table = vocab_lib.create_ids_to_tokens_table(vocab_file, num_oov_buckets=2)
+        self.assertEqual(self.evaluate(table.size()), 5)
+        tokens = table.lookup(tf.constant([[2, 0], [3, 4]]))
+        self.assertAllEqual(tokens, [[b"c", b"a"], [b"<unk>", b"<unk>"]])
+
+    def testGetTokenId(self):
+        vocab_file = self._saveVocab("vocab_token_id.txt", ["a", "<unk>", "c"])
+        self.assertEqual(vocab_lib.get_token_id(vocab_file, "<unk>"), 1)
+        self.assertIsNone(vocab_lib.get_token_id(vocab_file, "d"))
+
     def _saveVocab(self, name, words):
         vocab = vocab_lib.Vocab()
         for word in words:
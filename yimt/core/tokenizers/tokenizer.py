@@ -141,7 +141,10 @@ class Tokenizer(abc.ABC):
             else:
                 raise ValueError("Unsupported tensor rank %d for detokenization" % rank)
         elif isinstance(tokens, list) and tokens and isinstance(tokens[0], list):
-            return list(map(self.detokenize, tokens))
+            batch_tokens = [
+                [tf.compat.as_text(token) for token in sequence] for sequence in tokens
+            ]
+            return self._detokenize_string_batch(batch_tokens)
         else:
             tokens = [tf.compat.as_text(token) for token in tokens]
             return self._detokenize_string(tokens)
@@ -256,6 +259,17 @@ class Tokenizer(abc.ABC):
         """
         raise NotImplementedError()
 
+    def _detokenize_string_batch(self, batch_tokens):
+        """Detokenizes a batch of tokens.
+
+        Args:
+          batch_tokens: A list of lists of Python unicode strings.
+
+        Returns:
+          A list of unicode Python strings.
+        """
+        return [self._detokenize_string(tokens) for tokens in batch_tokens]
+
 
 _TOKENIZERS_REGISTRY = misc.ClassRegistry(base_class=Tokenizer)
 
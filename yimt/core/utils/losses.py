@@ -2,6 +2,8 @@
 
 import tensorflow as tf
 
+from yimt.core.utils import misc
+
 
 def _smooth_one_hot_labels(logits, labels, label_smoothing):
     num_classes = logits.shape[-1]
@@ -50,13 +52,21 @@ def cross_entropy_sequence_loss(
     Returns:
       A tuple (cumulated loss, loss normalizer, token-level normalizer).
     """
-    cross_entropy = _softmax_cross_entropy(logits, labels, label_smoothing, training)
-    dtype = cross_entropy.dtype
-
-    shape = tf.shape(logits)
+    shape = misc.shape_list(logits)
     batch_size = shape[0]
     max_time = shape[1]
 
+    # Compute the softmax on a 2D matrix [B * T, V] so that it runs as a single
+    # reduction over the vocabulary dimension.
+    cross_entropy = _softmax_cross_entropy(
+        tf.reshape(logits, [-1, shape[-1]]),
+        tf.reshape(labels, [-1]),
+        label_smoothing,
+        training,
+    )
+    cross_entropy = tf.reshape(cross_entropy, [batch_size, max_time])
+    dtype = cross_entropy.dtype
+
     if sequence_length is None:
         sequence_length = tf.fill([batch_size], max_time)
 